@@ -1,33 +1,77 @@
 import os 
-from openai import AzureOpenAI
 import json
-from dotenv import load_dotenv
-
-# ✅ Load the .env file
-load_dotenv()
-
-# Access environment variables (works in both local + Hugging Face Spaces)
-AZURE_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-MODEL_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
-API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")  # Default if not set
-
-# Initialize AzureOpenAI client
-client = AzureOpenAI(
-    api_key=AZURE_API_KEY,
-    azure_endpoint=AZURE_ENDPOINT,
-    api_version=API_VERSION
+import logging
+from concurrent.futures import as_completed
+from llm_async import run_sync, gather_limited, submit
+from llm_gateway import chat, achat, chat_stream
+from cache import SqliteCache, CACHE_DIR, make_key, normalize_text, normalize_number
+from refrange import classify
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever an analysis prompt changes so cached answers from the old prompt are ignored
+PROMPT_VERSION = "3"
+
+analysis_cache = SqliteCache(
+    os.getenv("ANALYSIS_CACHE_PATH", os.path.join(CACHE_DIR, "analysis_cache.sqlite3")),
+    table="analysis",
+    ttl=int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 24 * 3600))),
+    max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
 )
 
-def analyze_parameter(test_name, value, reference):
-    """Get AI analysis with strict output control"""
-    prompt = f"""Analyze this medical parameter:
+PARAMETER_OUTPUT_TOKENS = 150
+
+VALID_STATUSES = ("Good", "Moderate", "Immediate Attention")
+
+FALLBACK_ANALYSIS = {
+    "status": "Immediate Attention",
+    "reason": "Requires professional evaluation",
+    "food": "Maintain balanced diet",
+    "exercise": "Consult doctor"
+}
+
+# Batch analysis limits (rough token estimate of ~4 characters per token)
+BATCH_TOKEN_BUDGET = int(os.getenv("ANALYSIS_BATCH_TOKEN_BUDGET", "2500"))
+BATCH_MAX_ITEMS = int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", "25"))
+BATCH_MAX_RETRIES = 2
+OUTPUT_TOKENS_PER_ITEM = 90
+
+BATCH_INSTRUCTIONS = """Analyze each medical parameter listed below.
+
+    Return JSON with a "results" list containing one object per parameter, each with:
+    - id: the number shown before the parameter
+    - status: "Good"/"Moderate"/"Immediate Attention" (if a status is already given, return it unchanged)
+    - reason: 20-word explanation
+    - food: 3 specific food items
+    - exercise: 1 measurable activity
+
+    Example: {
+        "results": [
+            {
+                "id": 0,
+                "status": "Immediate Attention",
+                "reason": "High LDL increases cardiovascular risk",
+                "food": "Oats, walnuts, olive oil",
+                "exercise": "45-min daily brisk walking"
+            }
+        ]
+    }
+
+    Parameters:
+"""
+
+def _parameter_prompt(test_name, value, reference, status=None):
+    # When the reference range already decided the status, the model only writes the free-text fields
+    status_line = f"\n    Status: {status}" if status else ""
+    status_rule = f'"{status}" (already determined, return it unchanged)' if status else '"Good"/"Moderate"/"Immediate Attention"'
+    return f"""Analyze this medical parameter:
     Test: {test_name}
     Value: {value}
-    Reference: {reference}
+    Reference: {reference}{status_line}
 
     Return JSON with:
-    - status: "Good"/"Moderate"/"Immediate Attention"
+    - status: {status_rule}
     - reason: 20-word explanation
     - food: 3 specific food items
     - exercise: 1 measurable activity
@@ -39,30 +83,213 @@ def analyze_parameter(test_name, value, reference):
         "exercise": "45-min daily brisk walking"
     }}"""
 
+def _cache_key(test_name, value, reference):
+    return make_key(PROMPT_VERSION, normalize_text(test_name), normalize_number(value), normalize_text(reference))
+
+def _fallback_analysis(site, status=None):
+    metrics.record_fallback(site)
+    return _with_status(dict(FALLBACK_ANALYSIS), status)
+
+def _with_status(analysis, status):
+    """Locally computed statuses always win over the model's (and over older cached ones)"""
+    if analysis and status:
+        analysis["status"] = status
+    return analysis
+
+def analyze_parameter(test_name, value, reference):
+    """Get AI analysis with strict output control"""
+    status = classify(value, reference)
+    key = _cache_key(test_name, value, reference)
+    if cached := analysis_cache.get(key):
+        return _with_status(cached, status)
+
+    prompt = _parameter_prompt(test_name, value, reference, status)
+
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        response = chat(
+            [{"role": "user", "content": prompt}],
+            site="analyze_parameter",
             temperature=0.1,
             response_format={"type": "json_object"}
         )
 
-        print(json.dumps(response.choices[0].message.content, indent=4))
-        return json.loads(response.choices[0].message.content)
+        if valid := _validate_analysis(_with_status(json.loads(response.choices[0].message.content), status)):
+            analysis_cache.set(key, valid)
+            return valid
+        return _fallback_analysis("analyze_parameter", status)
     except Exception as e:
-        print(f"API Error: {str(e)}")
-        return {
-            "status": "Immediate Attention",
-            "reason": "Requires professional evaluation",
-            "food": "Maintain balanced diet",
-            "exercise": "Consult doctor"
-        }
+        logger.error(f"API Error: {str(e)}")
+        return _fallback_analysis("analyze_parameter", status)
 
-def generate_report_summary(raw_data):
-    """Generate an overall summary of the medical report"""
-    if not raw_data:
-        return "No medical data found in the report."
-    
+def _estimate_tokens(text):
+    """Cheap token estimate used to size batch requests"""
+    return len(text) // 4 + 1
+
+async def analyze_parameter_async(test_name, value, reference):
+    """Async variant of analyze_parameter that shares the deployment rate limiter"""
+    status = classify(value, reference)
+    key = _cache_key(test_name, value, reference)
+    if cached := analysis_cache.get(key):
+        return _with_status(cached, status)
+
+    try:
+        response = await achat(
+            [{"role": "user", "content": _parameter_prompt(test_name, value, reference, status)}],
+            site="analyze_parameter_async",
+            max_tokens=PARAMETER_OUTPUT_TOKENS,
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        if valid := _validate_analysis(_with_status(json.loads(response.choices[0].message.content), status)):
+            analysis_cache.set(key, valid)
+            return valid
+        return _fallback_analysis("analyze_parameter_async", status)
+    except Exception as e:
+        logger.error(f"API Error: {str(e)}")
+        return _fallback_analysis("analyze_parameter_async", status)
+
+def analyze_parameters_concurrently(items):
+    """One request per parameter, run concurrently within the rate limit, results in input order"""
+    return run_sync(gather_limited([
+        lambda item=item: analyze_parameter_async(item["test"], item["value"], item["reference"])
+        for item in items
+    ]))
+
+def _format_batch_line(index, item, status=None):
+    line = f"{index}. Test: {item['test']} | Value: {item['value']} | Reference: {item['reference']}"
+    return f"{line} | Status: {status}" if status else line
+
+def _validate_analysis(analysis):
+    """Return a clean analysis dict, or None if the model output is unusable"""
+    if not isinstance(analysis, dict) or analysis.get("status") not in VALID_STATUSES:
+        return None
+
+    cleaned = {"status": analysis["status"]}
+    for field in ("reason", "food", "exercise"):
+        text = analysis.get(field)
+        # Models occasionally return the food list as an array
+        if isinstance(text, list):
+            text = ", ".join(str(part) for part in text)
+        if not isinstance(text, str) or not text.strip():
+            return None
+        cleaned[field] = text.strip()
+    return cleaned
+
+def _chunk_indices(indices, items, statuses):
+    """Split item indices into chunks that fit the batch token budget"""
+    chunks, current, current_tokens = [], [], _estimate_tokens(BATCH_INSTRUCTIONS)
+    for index in indices:
+        line_tokens = _estimate_tokens(_format_batch_line(index, items[index], statuses[index]))
+        if current and (current_tokens + line_tokens > BATCH_TOKEN_BUDGET or len(current) >= BATCH_MAX_ITEMS):
+            chunks.append(current)
+            current, current_tokens = [], _estimate_tokens(BATCH_INSTRUCTIONS)
+        current.append(index)
+        current_tokens += line_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def _analyze_chunk(indices, items, statuses):
+    """Analyze one chunk in a single JSON-mode request, returning {index: analysis} for valid items"""
+    prompt = BATCH_INSTRUCTIONS + "\n".join(
+        "    " + _format_batch_line(index, items[index], statuses[index]) for index in indices
+    )
+
+    try:
+        response = await achat(
+            [{"role": "user", "content": prompt}],
+            site="analyze_batch",
+            max_tokens=OUTPUT_TOKENS_PER_ITEM * len(indices) + 50,
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        payload = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        logger.error(f"Batch API Error: {str(e)}")
+        return {}
+
+    analyses = {}
+    results = payload.get("results", []) if isinstance(payload, dict) else []
+    for result in results if isinstance(results, list) else []:
+        if not isinstance(result, dict):
+            continue
+        try:
+            index = int(result.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if index in indices and (analysis := _validate_analysis(_with_status(result, statuses[index]))):
+            analyses[index] = analysis
+    return analyses
+
+def _collect(futures, keys, analyzed, wait):
+    """Yield (index, analysis) from finished chunk futures, caching each; wait=True drains them all"""
+    for future in as_completed(list(futures)) if wait else [future for future in futures if future.done()]:
+        futures.remove(future)
+        for index, analysis in future.result().items():
+            analysis_cache.set(keys[index], analysis)
+            analyzed.add(index)
+            yield index, analysis
+
+def iter_parameter_analyses(items):
+    """Yield (index, analysis) pairs as soon as each one is available: cache hits first, then chunk by chunk.
+
+    `items` may be a lazy iterator (e.g. pdfhandle.iter_medical_pdf); each chunk is sent as soon
+    as it fills, so analysis of early rows overlaps parsing of later pages.
+    """
+    rows, statuses, keys, pending = [], [], [], []
+    analyzed, futures = set(), []
+    chunk, chunk_tokens = [], _estimate_tokens(BATCH_INSTRUCTIONS)
+    try:
+        for item in items:
+            index = len(rows)
+            rows.append(item)
+            statuses.append(classify(item["value"], item["reference"]))
+            keys.append(_cache_key(item["test"], item["value"], item["reference"]))
+            if cached := analysis_cache.get(keys[index]):
+                yield index, _with_status(cached, statuses[index])
+                continue
+
+            pending.append(index)
+            line_tokens = _estimate_tokens(_format_batch_line(index, item, statuses[index]))
+            if chunk and (chunk_tokens + line_tokens > BATCH_TOKEN_BUDGET or len(chunk) >= BATCH_MAX_ITEMS):
+                # Chunks are independent, so they go out concurrently under the shared rate limiter
+                futures.append(submit(lambda chunk=chunk: _analyze_chunk(chunk, rows, statuses)))
+                chunk, chunk_tokens = [], _estimate_tokens(BATCH_INSTRUCTIONS)
+            chunk.append(index)
+            chunk_tokens += line_tokens
+            yield from _collect(futures, keys, analyzed, wait=False)
+
+        if chunk:
+            futures.append(submit(lambda: _analyze_chunk(chunk, rows, statuses)))
+        yield from _collect(futures, keys, analyzed, wait=True)
+
+        for attempt in range(1, BATCH_MAX_RETRIES + 1):
+            pending = [index for index in pending if index not in analyzed]
+            if not pending:
+                break
+            logger.warning(f"Batch analysis: re-asking for {len(pending)} invalid items (attempt {attempt})")
+            futures.extend(
+                submit(lambda chunk=chunk: _analyze_chunk(chunk, rows, statuses))
+                for chunk in _chunk_indices(pending, rows, statuses)
+            )
+            yield from _collect(futures, keys, analyzed, wait=True)
+    finally:
+        # If the consumer stops early (e.g. a cancelled pipeline), drop the requests still queued
+        for future in futures:
+            future.cancel()
+
+    for index in pending:
+        if index not in analyzed:
+            yield index, _fallback_analysis("analyze_batch", statuses[index])
+
+def analyze_parameters(items):
+    """Analyze many parameters with batched requests, one result per item in input order"""
+    results = {}
+    for index, analysis in iter_parameter_analyses(items):
+        results[index] = analysis
+    return [results[index] for index in range(len(results))]
+
+def _summary_prompt(raw_data):
     # Create a simplified list of parameters for the summary
     parameters = []
     for item in raw_data:
@@ -70,7 +297,7 @@ def generate_report_summary(raw_data):
     
     parameters_text = "\n".join(parameters)
     
-    prompt = f"""Generate a concise summary of this medical report:
+    return f"""Generate a concise summary of this medical report:
     
     {parameters_text}
     
@@ -81,16 +308,51 @@ def generate_report_summary(raw_data):
     
     Keep it under 150 words, use simple language, and be honest but reassuring.
     """
+
+SUMMARY_FALLBACK = "Unable to generate summary. Please review the detailed analysis of each parameter."
+
+def generate_report_summary(raw_data):
+    """Generate an overall summary of the medical report"""
+    if not raw_data:
+        return "No medical data found in the report."
+    
+    prompt = _summary_prompt(raw_data)
     
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        response = chat(
+            [{"role": "user", "content": prompt}],
+            site="report_summary",
             temperature=0.3,
             max_tokens=300
         )
         
         return response.choices[0].message.content
     except Exception as e:
-        print(f"Summary generation error: {str(e)}")
-        return "Unable to generate summary. Please review the detailed analysis of each parameter."
\ No newline at end of file
+        logger.error(f"Summary generation error: {str(e)}")
+        metrics.record_fallback("report_summary")
+        return SUMMARY_FALLBACK
+
+def stream_report_summary(raw_data):
+    """Streaming variant of generate_report_summary that yields text deltas as they arrive"""
+    if not raw_data:
+        yield "No medical data found in the report."
+        return
+
+    received = False
+    try:
+        stream = chat_stream(
+            [{"role": "user", "content": _summary_prompt(raw_data)}],
+            site="report_summary_stream",
+            temperature=0.3,
+            max_tokens=300
+        )
+        for chunk in stream:
+            # Azure sends an initial chunk with no choices (content filter results)
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                received = True
+                yield delta
+    except Exception as e:
+        logger.error(f"Summary generation error: {str(e)}")
+        if not received:
+            metrics.record_fallback("report_summary_stream")
+            yield SUMMARY_FALLBACK
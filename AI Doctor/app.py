@@ -1,11 +1,18 @@
 import streamlit as st
-from pdfhandle import parse_medical_pdf
-from analyze import analyze_parameter, generate_report_summary
-from voice import get_medical_report_answer, play_audio_response
+from report_pipeline import report_job
+from metrics import start_metrics_server
+from jobs import get_job_manager
+from voice import get_medical_report_answer, play_audio_response, get_tts_client, ANSWER_FALLBACK
+from report_store import get_report_store, report_digest, REPORT_STORE_MAX_AGE_DAYS
+from audio_store import AUDIO_STORE_MAX_AGE_DAYS
+from stt import transcribe_recording
+from report_index import get_report_index
+from llm_gateway import get_client, get_async_client
+import importlib
 import os
-import tempfile
-import base64
-import pandas as pd
+import logging
+import threading
+import uuid
 
 st.set_page_config(
     page_title="AI Doctor",
@@ -13,6 +20,32 @@ st.set_page_config(
     page_icon="🩺"
 )
 
+# Optional Prometheus / per-report JSON endpoint (started once per process)
+if os.getenv("METRICS_PORT"):
+    start_metrics_server(int(os.getenv("METRICS_PORT")))
+
+# Heavy clients (OpenAI SDK, langchain, Google TTS, report store) are built in the background once per
+# process, so the first page renders without waiting for them and the first upload finds them ready
+@st.cache_resource(show_spinner=False)
+def warm_resources():
+    def warm():
+        try:
+            get_client()
+            get_async_client()
+            get_report_store()
+            get_tts_client()
+            # Imported for their side effect of loading the modules: the AI parsing fallback and the results tables
+            importlib.import_module("langchain.output_parsers")
+            importlib.import_module("pandas")
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Warm-up failed (resources will load on first use): {str(e)}")
+
+    thread = threading.Thread(target=warm, name="warm-resources", daemon=True)
+    thread.start()
+    return thread
+
+warm_resources()
+
 # Custom CSS for enhanced styling
 st.markdown("""
 <style>
@@ -236,79 +269,144 @@ if 'voice_response' not in st.session_state:
 # Add active tab tracking to session state
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = 0
+# Identifies this session to the job manager, which cancels jobs no session is waiting for
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Styled file upload section
 st.markdown('<div class="upload-section">', unsafe_allow_html=True)
 uploaded_file = st.file_uploader(
     "Upload Medical Report (PDF, max 10MB)", 
     type="pdf",
-    help="We never store your medical data. All processing happens on-demand.",
+    help=(f"The parsed values, analysis and your voice questions and answers are stored encrypted on this server "
+          f"for up to {REPORT_STORE_MAX_AGE_DAYS:g} days, so the same report opens instantly next time. "
+          f"Use \"Delete my stored report\" to remove them sooner."),
     accept_multiple_files=False
 )
 st.markdown('</div>', unsafe_allow_html=True)
 
-def get_binary_file_downloader_html(bin_file, file_label='File'):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    b64 = base64.b64encode(data).decode()
-    href = f'<a href="data:audio/mp3;base64,{b64}" download="{file_label}.mp3" class="download-button">Download {file_label} 📥</a>'
-    return href
-
 # Function to update active tab in session state
 def set_active_tab(tab_idx):
     st.session_state.active_tab = tab_idx
 
+# Voice answers are stored with the report, so a repeated question skips the LLM, translation and TTS
+def answer_question(report_store, file_hash, summary, categorized, tamil_text=None):
+    if tamil_text and report_store and (stored := report_store.get_answer(file_hash, tamil_text)):
+        play_audio_response(stored.get("audio"))
+        return stored
+    
+    # Each sentence starts playing as soon as it is synthesized; the first replaces any answer still playing
+    queued = []
+    def on_audio(audio):
+        play_audio_response(audio, reset=not queued)
+        queued.append(audio)
+    
+    # Built once per report and reused for every question; prompts then stay small even for long reports
+    report_index = get_report_index(file_hash, categorized) if categorized else None
+    response = get_medical_report_answer(summary, tamil_text, on_audio, report_index)
+    if report_store and response["original_query"] and response["english_response"] != ANSWER_FALLBACK:
+        answer = {key: value for key, value in response.items() if key != "audio"}
+        report_store.put_answer(file_hash, response["original_query"], answer, response["audio"])
+    return response
+
+# Live view of a queued report job; reruns every half second without rerunning the rest of the page
+@st.fragment(run_every=0.5)
+def show_job_progress(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        st.error("The analysis job has expired. Please upload the report again.")
+        return
+    snapshot = job.snapshot()
+    if snapshot["status"] == "done":
+        # A full rerun attaches the results to this session
+        st.rerun()
+    if snapshot["status"] == "failed":
+        st.error(f"Analysis failed: {snapshot['error']}")
+        # Failed jobs are kept for a cooldown so reruns don't repeat the paid calls; retrying is explicit
+        if st.button("🔁 Retry", key=f"retry_{job_id}"):
+            get_job_manager().forget(job.key)
+            st.rerun()
+        return
+    
+    stages = snapshot["stages"]
+    parsed = stages.get("parse", {}).get("done", 0)
+    analysed = stages.get("analyses", {}).get("done", 0)
+    st.markdown("<h2 class='subheader'>Report Summary</h2>", unsafe_allow_html=True)
+    if summary := snapshot["partial"].get("summary"):
+        st.markdown(f"<div class='report-summary'>{summary}▌</div>", unsafe_allow_html=True)
+    st.markdown("<h2 class='subheader'>Detailed Analysis</h2>", unsafe_allow_html=True)
+    if snapshot["status"] == "queued":
+        st.progress(0.0, text="Waiting for a free analysis worker...")
+    elif stages.get("parse", {}).get("status") != "done":
+        st.progress(analysed / max(parsed, 1), text=f"{parsed} parameters found so far...")
+    else:
+        st.progress(analysed / max(parsed, 1), text=f"Analyzed {analysed} of {parsed} parameters...")
+    if rows := snapshot["partial"].get("rows"):
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+def follow_job(job_id):
+    """Make job_id this session's job; the one it replaces is cancelled unless another session is waiting on it"""
+    previous = st.session_state.get("job_id")
+    if previous and previous != job_id:
+        get_job_manager().unsubscribe(previous, st.session_state.session_id)
+    st.session_state.job_id = job_id
+
 # Main application flow
 if uploaded_file:
+    # Imported here rather than at the top so the landing page doesn't wait for pandas
+    import pandas as pd
+
     if uploaded_file.size > 10 * 1024 * 1024:
         st.error("❌ File size exceeds 10MB limit")
         st.stop()
     
-    # Only process the PDF if it hasn't been processed yet or a new file was uploaded
-    file_hash = hash(uploaded_file.getvalue())
+    # Only process the PDF if it hasn't been processed yet or a new file was uploaded.
+    # The SHA-256 digest is stable across processes, so any session on this host can reuse the stored result.
+    file_hash = report_digest(uploaded_file.getvalue())
+    report_store = get_report_store()
+    if st.session_state.get("deleted_report") == file_hash:
+        st.info("The stored data for this report has been deleted. Remove the file above, or analyze it again.")
+        if st.button("Analyze again"):
+            del st.session_state["deleted_report"]
+            st.rerun()
+        st.stop()
     if 'file_hash' not in st.session_state or file_hash != st.session_state.file_hash:
-        with st.spinner("Analyzing your medical report..."):
-            try:
-                # Process PDF
-                st.session_state.raw_data = parse_medical_pdf(uploaded_file)
-                st.session_state.file_hash = file_hash
-                
-                if not st.session_state.raw_data:
-                    st.error("No parameters found in document. Please ensure this is a standard medical report.")
-                    st.stop()
-                
-                # Generate summary
-                st.session_state.summary = generate_report_summary(st.session_state.raw_data)
-                
-                # Process analysis
-                categorized = {
-                    "Good": [],
-                    "Moderate": [],
-                    "Immediate Attention": []
-                }
-                
-                for item in st.session_state.raw_data:
-                    analysis = analyze_parameter(
-                        item["test"], 
-                        item["value"], 
-                        item["reference"]
-                    )
-                    row = {
-                        "Parameter": item["test"],
-                        "Value": f"{item['value']} (Ref: {item['reference']})",
-                        "Clinical Significance": analysis["reason"],
-                        "Dietary Recommendation": analysis["food"],
-                        "Activity Guidance": analysis["exercise"],
-                        "Status": analysis["status"]
-                    }
-                    categorized[analysis["status"]].append(row)
-                
-                st.session_state.categorized = categorized
-                
-            except Exception as e:
-                st.error(f"Analysis failed: {str(e)}")
+        if stored := report_store.get_report(file_hash) if report_store else None:
+            # Seen before: restore instantly instead of re-parsing and re-analyzing
+            follow_job(None)
+            st.session_state.raw_data = stored["raw_data"]
+            st.session_state.categorized = stored["categorized"]
+            st.session_state.summary = stored["summary"]
+            st.session_state.report_metrics = None
+            st.session_state.file_hash = file_hash
+            st.session_state.voice_response = None
+        else:
+            # The analysis runs on the shared worker pool, not in this script: reruns and widget clicks
+            # don't restart it, and the same PDF uploaded in another session joins the running job
+            job = get_job_manager().submit(file_hash, report_job, uploaded_file.getvalue(), file_hash,
+                                          subscriber=st.session_state.session_id)
+            follow_job(job.id)
+            if job.status != "done":
+                show_job_progress(job.id)
                 st.stop()
-    
+            
+            st.session_state.raw_data = job.result["raw_data"]
+            st.session_state.categorized = job.result["categorized"]
+            st.session_state.summary = job.result["summary"]
+            st.session_state.report_metrics = job.result["report_metrics"]
+            st.session_state.file_hash = file_hash
+            st.session_state.voice_response = None
+    
+    if st.button("🗑️ Delete my stored report", help="Remove this report's stored analysis and voice answers now"):
+        if report_store:
+            report_store.delete_report(file_hash)
+        # The finished job keeps the result in memory too
+        get_job_manager().forget(file_hash)
+        for key in ("file_hash", "raw_data", "categorized", "summary", "report_metrics", "voice_response"):
+            st.session_state.pop(key, None)
+        st.session_state.deleted_report = file_hash
+        st.rerun()
+
     # Create tabs with specified active tab from session state and improved icons
     tab_titles = ["📊 Summary", "🔍 Detailed Analysis", "🗣️ Voice Assistant"]
     
@@ -392,13 +490,25 @@ if uploaded_file:
         col1, col2 = st.columns(2)
         
         with col1:
-            # Button for voice input
-            if st.button("🎤 Ask Questions (you may speak in Tamil)", type="primary", key="listen_button"):
+            # Recorded in the browser, so every user has their own microphone and nothing waits on the server's
+            recording = st.audio_input("🎤 Ask Questions (you may speak in Tamil)", key="voice_recording")
+            if recording and recording.file_id != st.session_state.get("voice_recording_id"):
+                st.session_state.voice_recording_id = recording.file_id
                 # Update the active tab in session state
                 st.session_state.active_tab = 2
                 
-                # Process voice input
-                st.session_state.voice_response = get_medical_report_answer(st.session_state.summary)
+                # Transcribe (partial results show as they arrive), then answer
+                partial_placeholder = st.empty()
+                tamil_text = transcribe_recording(
+                    recording.getvalue(),
+                    st.session_state.setdefault("stt_calibration", {}),
+                    lambda text: partial_placeholder.caption(f"🎧 {text}…")
+                )
+                partial_placeholder.empty()
+                if tamil_text:
+                    st.session_state.voice_response = answer_question(report_store, file_hash, st.session_state.summary, st.session_state.categorized, tamil_text)
+                else:
+                    st.error("❌ Could not understand the speech. Please try again more clearly.")
                 
                 # Use JavaScript to ensure we stay on Voice Assistant tab
                 st.components.v1.html("""
@@ -419,7 +529,7 @@ if uploaded_file:
                 st.session_state.active_tab = 2
                 
                 with st.spinner("Processing your query..."):
-                    st.session_state.voice_response = get_medical_report_answer(st.session_state.summary, tamil_text)
+                    st.session_state.voice_response = answer_question(report_store, file_hash, st.session_state.summary, st.session_state.categorized, tamil_text)
                 
                 # Use JavaScript to ensure we stay on Voice Assistant tab
                 st.components.v1.html("""
@@ -460,17 +570,14 @@ if uploaded_file:
                 st.markdown(f"<div class='response-box'>{response['tamil_response']}</div>", unsafe_allow_html=True)
             
             # Audio playback with auto-play and improved styling
-            if response["audio_file"] and os.path.exists(response["audio_file"]):
+            if response.get("audio"):
                 st.markdown("<h3>🔊 Voice Response</h3>", unsafe_allow_html=True)
                 
-                # Auto-play the audio
-                play_audio_response(response["audio_file"])
-                
-                # Display audio controls for manual replay
-                st.audio(response["audio_file"])
-                
-                # Download button with better styling
-                st.markdown(get_binary_file_downloader_html(response["audio_file"], 'Audio Response'), unsafe_allow_html=True)
+                # The answer already played while it was synthesized. The player and the download reference the
+                # same bytes, which Streamlit serves from its media storage over HTTP rather than as base64 in the page
+                st.audio(response["audio"], format="audio/mp3")
+                st.download_button("Download Audio Response 📥", response["audio"],
+                                   file_name="Audio Response.mp3", mime="audio/mp3")
     
     # We don't need complex JavaScript for tabs anymore since we're using direct click events
     # This is much simpler and more reliable
@@ -503,14 +610,14 @@ else:
         """, unsafe_allow_html=True)
     
     with col2:
-        st.markdown("""
+        st.markdown(f"""
         <div style="background-color: #f0f7ff; padding: 20px; border-radius: 10px; height: 100%;">
         <h3>Privacy & Security</h3>
         
         <ul style="margin-top: 15px;">
-            <li>Your medical data is processed securely and never stored</li>
-            <li>All analysis happens on-demand</li>
-            <li>Voice data is only used for processing your queries</li>
+            <li>Parsed report values, analyses and voice answers are stored encrypted on this server for up to {REPORT_STORE_MAX_AGE_DAYS:g} days, so the same report opens instantly</li>
+            <li>"Delete my stored report" removes them at any time; cached speech audio and translations expire on their own after {AUDIO_STORE_MAX_AGE_DAYS:g} days</li>
+            <li>Voice recordings are only used to transcribe your question and are not kept</li>
             <li>We prioritize your data privacy and security</li>
         </ul>
         </div>
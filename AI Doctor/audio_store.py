@@ -0,0 +1,139 @@
+# audio_store.py - synthesized speech stored (encrypted) by content hash, so repeated phrases skip Google TTS
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import metrics
+from cache import CACHE_DIR
+from report_store import load_store_key
+
+logger = logging.getLogger(__name__)
+
+AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR", os.path.join(CACHE_DIR, "tts"))
+AUDIO_STORE_MAX_MB = float(os.getenv("AUDIO_STORE_MAX_MB", "200"))
+AUDIO_STORE_MAX_AGE_DAYS = float(os.getenv("AUDIO_STORE_MAX_AGE_DAYS", "30"))
+# Expired files nobody reads again are swept this often; size is tracked per write in between
+SWEEP_INTERVAL_SECONDS = 3600
+SUFFIX = ".audio"
+
+
+def audio_key(text, voice, speaking_rate):
+    """Digest of everything that changes the synthesized audio"""
+    return hashlib.sha256(f"{voice}\x1f{speaking_rate:g}\x1f{text}".encode("utf-8")).hexdigest()
+
+
+class AudioStore:
+    """One encrypted file per digest; names never collide between sessions, and the least recently used go first"""
+
+    def __init__(self, directory, max_bytes, max_age, key):
+        from cryptography.fernet import Fernet
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._fernet = Fernet(key)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            # Plaintext mp3s written before audio was encrypted
+            if entry.name.endswith(".mp3"):
+                os.remove(entry.path)
+        self._total = 0
+        self._last_sweep = 0.0
+        with self._lock:
+            self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{SUFFIX}")
+
+    def get(self, key):
+        from cryptography.fernet import InvalidToken
+
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.max_age:
+                os.remove(path)
+                with self._lock:
+                    self._total -= stat.st_size
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                audio = self._fernet.decrypt(f.read())
+            # mtime doubles as the last-access time for eviction
+            os.utime(path)
+        except (FileNotFoundError, InvalidToken):
+            # InvalidToken: written under another key; it is overwritten on the next synthesis
+            metrics.record_cache("tts_audio", hit=False)
+            return None
+        metrics.record_cache("tts_audio", hit=True)
+        return audio
+
+    def put(self, key, audio):
+        data = self._fernet.encrypt(audio)
+        path = self._path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        # Write to a temp file and rename, so a concurrent reader never sees a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total += len(data) - replaced
+            # Only rescan the directory when over the limit, or for the periodic sweep of expired files
+            if self._total > self.max_bytes or time.time() - self._last_sweep > SWEEP_INTERVAL_SECONDS:
+                self._evict()
+
+    def _evict(self):
+        now = time.time()
+        self._last_sweep = now
+        entries, total = [], 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        # Expired files first, then the least recently used until 10% under the limit
+        target = total - self.max_bytes + self.max_bytes // 10 if total > self.max_bytes else 0
+        freed, evicted = 0, 0
+        for mtime, size, path in sorted(entries):
+            if now - mtime <= self.max_age and freed >= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            freed += size
+            evicted += 1
+        # The scan also corrects the running total for files other processes wrote or removed
+        self._total = total - freed
+        if evicted:
+            logger.info(f"Evicted {evicted} stored audio files ({freed / 1e6:.1f} MB)")
+
+    def stats(self):
+        sizes = [entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(SUFFIX)]
+        return {"entries": len(sizes), "bytes": sum(sizes), "max_bytes": self.max_bytes}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store():
+    """The process-wide audio store, or None if it can't be opened (TTS then runs every time)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                # Spoken findings are as sensitive as the report: same key as report_store, never plaintext
+                _store = AudioStore(AUDIO_STORE_DIR, int(AUDIO_STORE_MAX_MB * 1024 * 1024),
+                                    AUDIO_STORE_MAX_AGE_DAYS * 24 * 3600, load_store_key())
+            except Exception as e:
+                logger.error(f"Could not open audio store at {AUDIO_STORE_DIR}: {str(e)}")
+                _store = False
+        return _store or None
@@ -0,0 +1,241 @@
+# batch.py - headless bulk processing of lab-report PDFs: extract in a process pool, analyze under the shared LLM limits
+#
+#   python batch.py /data/reports/2025-06-01 --output results.jsonl --parquet results.parquet
+#   python batch.py --manifest tonight.txt --output results.jsonl --parse-workers 4 --concurrency 16
+#
+# The JSONL output doubles as the checkpoint: rerunning the same command skips every report already
+# written successfully, so an interrupted night resumes where it stopped. Failed reports, and "partial" ones
+# where any answer is a fallback, are retried.
+import argparse
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+logger = logging.getLogger("batch")
+
+PARSE_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Reports analysed at once; the LLM requests they make share llm_async's rate limiter and concurrency cap
+REPORTS_IN_FLIGHT = int(os.getenv("BATCH_REPORTS_IN_FLIGHT", "8"))
+PARQUET_COLUMNS = ("source", "digest", "Parameter", "Value", "Status", "Clinical Significance",
+                   "Dietary Recommendation", "Activity Guidance")
+
+
+def find_pdfs(inputs, manifest=None):
+    """PDF paths from files, directories (searched recursively) and a manifest of one path per line"""
+    paths = []
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                if (line := line.strip()) and not line.startswith("#"):
+                    paths.append(os.path.join(base, line))
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                paths.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(".pdf"))
+        else:
+            paths.append(path)
+    return paths
+
+
+def load_checkpoint(output):
+    """Digests already written successfully to the JSONL output"""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; that report simply runs again
+                continue
+            if record.get("status") == "ok":
+                done.add(record["digest"])
+    return done
+
+
+def _init_parse_worker():
+    import pdfhandle
+    logging.disable(logging.INFO)
+    # Each worker already parses a whole document; page-range pools inside it would only oversubscribe the CPUs
+    pdfhandle.PARALLEL_MIN_PAGES = float("inf")
+
+
+def parse_file(path):
+    """Process-pool worker: (rows, page texts, seconds) for one PDF.
+
+    Regex and layout parsing only; LLM calls stay in the parent, where every report shares one rate limiter.
+    The page texts are returned only when nothing was found, for the parent's AI fallback."""
+    from pdfhandle import PdfDocument, iter_local_parse
+
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        document = PdfDocument(io.BytesIO(f.read()))
+    rows = list(iter_local_parse(document))
+    texts = None if rows else [page["text"] for page in document.iter_pages()]
+    return rows, texts, time.perf_counter() - started
+
+
+def analyze_report(path, digest, raw_data, texts, parse_seconds):
+    """Analyses and summary for parsed rows (AI-parsed from texts when the worker found none); a complete
+    result is also put in the report store the app reads, one with fallback answers is marked partial"""
+    from analyze import analyze_parameters, generate_report_summary
+    from pdfhandle import ExtractedText, ai_based_parse
+    from report_pipeline import build_analysis_row, has_fallbacks, STATUSES
+    from report_store import get_report_store
+    import metrics
+
+    started = time.perf_counter()
+    with metrics.report_scope(digest[:12]) as report:
+        if not raw_data and texts:
+            raw_data = ai_based_parse(ExtractedText(texts))
+            metrics.record_parse("ai" if raw_data else "none")
+        if not raw_data:
+            raise ValueError("No parameters found in document")
+        analyses = analyze_parameters(raw_data)
+        summary = generate_report_summary(raw_data)
+    categorized = {status: [] for status in STATUSES}
+    for item, analysis in zip(raw_data, analyses):
+        categorized[analysis["status"]].append(build_analysis_row(item, analysis))
+    breakdown = report.breakdown()
+    status = "partial" if has_fallbacks(categorized, summary, breakdown) else "ok"
+    if status == "ok" and (report_store := get_report_store()):
+        report_store.put_report(digest, raw_data, categorized, summary)
+
+    totals = breakdown["totals"]
+    return {
+        "source": path, "digest": digest, "status": status, "parameters": len(raw_data),
+        "raw_data": raw_data, "categorized": categorized, "summary": summary,
+        "parse_seconds": round(parse_seconds, 3), "analysis_seconds": round(time.perf_counter() - started, 3),
+        "llm_calls": totals["calls"], "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"], "fallbacks": totals["fallbacks"]
+    }
+
+
+def write_parquet(output, parquet):
+    """One row per analysed parameter from the successful JSONL records (the latest record per report wins)"""
+    import pandas as pd
+
+    records = {}
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                records[record["digest"]] = record
+    rows = [{"source": record["source"], "digest": digest, **row}
+            for digest, record in records.items()
+            for status_rows in record["categorized"].values() for row in status_rows]
+    pd.DataFrame(rows, columns=PARQUET_COLUMNS).to_parquet(parquet, index=False)
+    logger.info(f"Wrote {len(rows)} parameters from {len(records)} reports to {parquet}")
+
+
+def run_batch(paths, output, parse_workers=PARSE_WORKERS, concurrency=REPORTS_IN_FLIGHT):
+    """Process every PDF not yet in the output; returns the throughput summary"""
+    done = load_checkpoint(output)
+    todo, skipped = {}, 0
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            logger.error(f"Cannot read {path}: {str(e)}")
+            todo[path] = None
+            continue
+        # The same PDF listed twice (or already done in an earlier run) is processed once
+        if digest in done:
+            skipped += 1
+        else:
+            todo[path] = digest
+            done.add(digest)
+
+    stats = {"reports": len(paths), "skipped": skipped, "ok": 0, "partial": 0, "failed": 0, "parameters": 0, "llm_calls": 0,
+             "prompt_tokens": 0, "completion_tokens": 0, "fallbacks": 0, "parse_seconds": 0.0}
+    started = time.perf_counter()
+    # spawn, not fork: the parent runs the LLM event-loop thread, which a forked child must not inherit
+    parsers = ProcessPoolExecutor(max_workers=parse_workers, initializer=_init_parse_worker,
+                                  mp_context=multiprocessing.get_context("spawn"))
+    analysts = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    with parsers, analysts, open(output, "a", encoding="utf-8") as out:
+        parsing = {parsers.submit(parse_file, path): path for path, digest in todo.items() if digest}
+        analysing = {}
+        for path, digest in todo.items():
+            if not digest:
+                out.write(json.dumps({"source": path, "digest": None, "status": "failed",
+                                      "error": "unreadable"}) + "\n")
+                stats["failed"] += 1
+        pending = set(parsing)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = parsing.get(future) or analysing[future]
+                try:
+                    if future in parsing:
+                        # Parsed: analysis starts right away while other files are still being parsed
+                        rows, texts, seconds = future.result()
+                        stats["parse_seconds"] += seconds
+                        analysis = analysts.submit(analyze_report, path, todo[path], rows, texts, seconds)
+                        analysing[analysis] = path
+                        pending.add(analysis)
+                        continue
+                    record = future.result()
+                except Exception as e:
+                    logger.error(f"{path} failed: {str(e)}")
+                    record = {"source": path, "digest": todo[path], "status": "failed", "error": str(e)}
+                    stats["failed"] += 1
+                else:
+                    stats[record["status"]] += 1
+                    for key in ("parameters", "llm_calls", "prompt_tokens", "completion_tokens", "fallbacks"):
+                        stats[key] += record[key]
+                    logger.info(f"[{stats['ok'] + stats['partial'] + stats['failed']}/{len(todo)}] {path}: "
+                                f"{record['parameters']} parameters ({record['status']})")
+                # Flushed per report so a crash loses at most the reports still in flight
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+    elapsed = time.perf_counter() - started
+    stats["parse_seconds"] = round(stats["parse_seconds"], 3)
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["reports_per_minute"] = round(stats["ok"] / elapsed * 60, 1) if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse, analyze and summarize a batch of lab-report PDFs")
+    parser.add_argument("inputs", nargs="*", help="PDF files or directories (searched recursively)")
+    parser.add_argument("--manifest", help="Text file listing one PDF path per line")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL results; also the resume checkpoint")
+    parser.add_argument("--parquet", help="Also write one row per parameter to this Parquet file")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--concurrency", type=int, default=REPORTS_IN_FLIGHT, help="Reports analysed at once")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+    if not args.inputs and not args.manifest:
+        parser.error("give PDF files/directories or --manifest")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    paths = find_pdfs(args.inputs, args.manifest)
+    summary = run_batch(paths, args.output, args.parse_workers, args.concurrency)
+    if args.parquet:
+        write_parquet(args.output, args.parquet)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for key, value in summary.items():
+            print(f"{key:>20}: {value}")
+    return 1 if summary["failed"] or summary["partial"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
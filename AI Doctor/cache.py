@@ -0,0 +1,170 @@
+# cache.py - persistent SQLite cache for LLM results
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+def normalize_text(text):
+    """Lower-case and collapse whitespace so trivial formatting differences share a key"""
+    return re.sub(r'\s+', ' ', str(text)).strip().lower()
+
+
+def normalize_number(value):
+    """Canonical form of a numeric value ("5.40" and "5.4" map to the same key)"""
+    try:
+        return format(float(str(value).replace(',', '')), 'g')
+    except ValueError:
+        return normalize_text(value)
+
+
+def make_key(*parts):
+    """Content-addressed key for a tuple of already-normalized parts"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class SqliteCache:
+    """Key/value cache stored in SQLite with a TTL and size-bounded LRU eviction"""
+
+    def __init__(self, path, table="cache", ttl=30 * 24 * 3600, max_entries=50000):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                metrics.record_cache(self.table, hit=True)
+                return json.loads(row[0])
+            if row:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.misses += 1
+            metrics.record_cache(self.table, hit=False)
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Trim an extra 10% so eviction doesn't run on every insert once the cache is full
+        excess = count - self.max_entries + self.max_entries // 10
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN "
+            f"(SELECT key FROM {self.table} ORDER BY accessed ASC LIMIT ?)",
+            (excess,)
+        )
+        logger.info(f"Evicted {excess} least recently used entries from {self.table}")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+
+class TieredCache:
+    """In-memory LRU in front of a SqliteCache, so repeat lookups in a process skip SQLite entirely"""
+
+    def __init__(self, disk, max_items=2048, memory_ttl=3600):
+        self.disk = disk
+        self.max_items = max_items
+        # Entries promoted from disk restart their clock, so keep the memory tier's lifetime short
+        self.memory_ttl = min(memory_ttl, disk.ttl)
+        self.memory_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] <= self.memory_ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                metrics.record_cache(f"{self.disk.table}_memory", hit=True)
+                return entry[0]
+            self._memory.pop(key, None)
+        metrics.record_cache(f"{self.disk.table}_memory", hit=False)
+        value = self.disk.get(key)
+        if value is not None:
+            self._remember(key, value, now)
+        return value
+
+    def set(self, key, value):
+        self.disk.set(key, value)
+        self._remember(key, value, time.time())
+
+    def _remember(self, key, value, created):
+        with self._lock:
+            self._memory[key] = (value, created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self.disk.clear()
+
+    def stats(self):
+        disk = self.disk.stats()
+        lookups = self.memory_hits + disk["hits"] + disk["misses"]
+        with self._lock:
+            memory_entries = len(self._memory)
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": disk["hits"],
+            "misses": disk["misses"],
+            "hit_rate": (self.memory_hits + disk["hits"]) / lookups if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "entries": disk["entries"]
+        }
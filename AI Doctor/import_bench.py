@@ -0,0 +1,72 @@
+# import_bench.py - measure what `import app` costs on a cold start, module by module
+#
+#   python import_bench.py                        # total + slowest modules for app.py
+#   python import_bench.py --save before.json     # keep a baseline
+#   python import_bench.py --baseline before.json # compare against it
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module):
+    """{module: cumulative microseconds} from one fresh interpreter running `python -X importtime`"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # Streamlit's bare-mode warnings go to stderr too; only importtime lines are parsed
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, env=env, capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    if module not in times:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return times
+
+
+def measure(module, runs):
+    """Median cumulative time per module over several cold interpreters"""
+    samples = [import_times(module) for _ in range(runs)]
+    names = set().union(*samples)
+    return {name: statistics.median(sample.get(name, 0) for sample in samples) for name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time of the Streamlit app")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--save", help="Write the measurement to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a measurement saved with --save")
+    args = parser.parse_args()
+
+    times = measure(args.module, args.runs)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # Top-level packages only, so "openai" isn't listed again for each of its submodules
+    top = sorted(((name, us) for name, us in times.items() if "." not in name and name != args.module),
+                 key=lambda item: -item[1])[:args.top]
+    print(f"{'module':<32}{'ms':>9}" + (f"{'baseline':>11}" if baseline else ""))
+    for name, us in [(args.module, times[args.module])] + top:
+        line = f"{name:<32}{us / 1000:>9.1f}"
+        if baseline:
+            line += f"{baseline.get(name, 0) / 1000:>11.1f}"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(times, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
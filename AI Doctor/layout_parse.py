@@ -0,0 +1,241 @@
+# layout_parse.py - deterministic table extraction from word coordinates and ruled tables
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Header words that identify a column; words like "name" or "interval" just extend the phrase they sit in
+ROLE_SYNONYMS = {
+    "test": {"test", "tests", "investigation", "investigations", "parameter", "parameters", "description",
+             "examination", "analyte", "component"},
+    "value": {"result", "results", "value", "values", "observed", "observation", "finding", "findings"},
+    "unit": {"unit", "units", "uom"},
+    "reference": {"reference", "ref", "range", "interval", "bio", "biological", "normal", "limits"},
+    None: {"method", "flag", "specimen", "sample", "remarks", "status"},
+}
+KEYWORDS = {word: role for role, words in ROLE_SYNONYMS.items() for word in words}
+
+LINE_TOLERANCE = 3          # words whose tops differ by less than this share a line
+PHRASE_GAP_CHARS = 1.5      # a gap wider than this many average characters starts a new cell
+CLUSTER_TOLERANCE = 12      # cell starts within this many points belong to the same column
+CLUSTER_SUPPORT = 0.6       # share of candidate lines a column must appear in
+SKIP_PREFIXES = ("disclaimer", "note", "page ", "end of report", "interpretation", "method")
+
+value_pattern = re.compile(r'^[<>]?\d+(?:\.\d+)?')
+range_pattern = re.compile(r'\d\s*(?:-|–|to)\s*\d|[<>≤≥]\s*\d|(?:less|more|greater) than', re.IGNORECASE)
+
+
+def _norm(word):
+    return re.sub(r'[^a-z]', '', word.lower())
+
+
+def _group_lines(words):
+    """Group a page's words into lines (top to bottom), each sorted left to right"""
+    lines = []
+    for word in sorted(words, key=lambda w: (round(w["top"]), w["x0"])):
+        if lines and abs(lines[-1][0]["top"] - word["top"]) < LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w["x0"]) for line in lines]
+
+
+def _phrases(line):
+    """Split a line into cells wherever the horizontal gap is wider than a couple of characters"""
+    chars = sum(len(w["text"]) for w in line) or 1
+    gap = PHRASE_GAP_CHARS * sum(w["x1"] - w["x0"] for w in line) / chars
+    phrases = [[line[0]]]
+    for word in line[1:]:
+        if word["x0"] - phrases[-1][-1]["x1"] > gap:
+            phrases.append([word])
+        else:
+            phrases[-1].append(word)
+    return [{"text": " ".join(w["text"] for w in p), "x0": p[0]["x0"], "x1": p[-1]["x1"]} for p in phrases]
+
+
+def _phrase_role(text):
+    for word in text.split():
+        if (key := _norm(word)) in KEYWORDS:
+            return KEYWORDS[key]
+    return "unknown"
+
+
+def _is_header(roles):
+    return "test" in roles and "value" in roles and ("reference" in roles or "unit" in roles)
+
+
+def _header_columns(line):
+    """Columns (role, x0, x1) when the line is a header row, else None"""
+    columns = [(_phrase_role(p["text"]), p["x0"], p["x1"]) for p in _phrases(line)]
+    return columns if _is_header([role for role, _, _ in columns]) else None
+
+
+def _cluster_columns(lines):
+    """Infer columns from the x positions of cells on lines that look like data rows"""
+    candidates = []
+    for line in lines:
+        phrases = _phrases(line)
+        if len(phrases) >= 2 and any(value_pattern.match(p["text"]) for p in phrases[1:]):
+            candidates.append(phrases)
+    if len(candidates) < 3:
+        return None
+
+    clusters = []
+    for phrase in sorted((p for phrases in candidates for p in phrases), key=lambda p: p["x0"]):
+        if clusters and phrase["x0"] - clusters[-1][-1]["x0"] <= CLUSTER_TOLERANCE:
+            clusters[-1].append(phrase)
+        else:
+            clusters.append([phrase])
+    clusters = [c for c in clusters if len(c) >= CLUSTER_SUPPORT * len(candidates)]
+    if len(clusters) < 2:
+        return None
+
+    def share(cluster, test):
+        return sum(1 for p in cluster if test(p["text"])) / len(cluster)
+
+    roles = ["test"] + [None] * (len(clusters) - 1)
+    value_index = next((i for i in range(1, len(clusters))
+                        if share(clusters[i], lambda t: value_pattern.match(t) and not range_pattern.search(t)) >= 0.6), None)
+    if value_index is None:
+        return None
+    roles[value_index] = "value"
+    rest = range(value_index + 1, len(clusters))
+    reference_index = max(rest, key=lambda i: share(clusters[i], range_pattern.search), default=None)
+    if reference_index is not None and share(clusters[reference_index], range_pattern.search) >= 0.5:
+        roles[reference_index] = "reference"
+    unit_index = next((i for i in rest if roles[i] is None
+                       and share(clusters[i], lambda t: not value_pattern.match(t)) >= 0.6), None)
+    if unit_index is not None:
+        roles[unit_index] = "unit"
+    return [(role, min(p["x0"] for p in c), max(p["x1"] for p in c)) for role, c in zip(roles, clusters)]
+
+
+def _assign(line, columns):
+    """Bucket a line's words into column roles; boundaries sit midway between neighbouring columns"""
+    bounds = [float("-inf")] + [
+        (prev[2] + cur[1]) / 2 if prev[2] < cur[1] else cur[1]
+        for prev, cur in zip(columns, columns[1:])
+    ]
+    cells = {}
+    for word in line:
+        index = max(i for i, bound in enumerate(bounds) if word["x0"] >= bound - 1)
+        role = columns[index][0]
+        cells[role] = f"{cells.get(role, '')} {word['text']}".strip()
+    return cells
+
+
+def _row(test, value_text, unit, reference, source):
+    match = value_pattern.match(value_text.strip())
+    if not match or not re.search(r'[A-Za-z]', test):
+        return None
+    return {
+        "test": test.strip(),
+        # "<0.5" keeps its qualifier: it is a detection limit, not a measurement of 0.5
+        "value": match.group(),
+        "reference": f"{reference.strip()} {unit.strip()}".strip(),
+        "source": source
+    }
+
+
+class _RowBuilder:
+    """Turns cells into rows, joining test names that wrap onto an extra line"""
+
+    def __init__(self, source):
+        self.source = source
+        self.rows = []
+        self.pending = None
+        self.last_bottom = None
+        self.row_gaps = []
+
+    def _wraps(self, text, gap):
+        """Whether a name-only line continues the neighbouring row's name rather than starting something new"""
+        if text[0] in "([" or text[0].islower():
+            return True
+        if self.row_gaps and gap is not None:
+            # Wrapped lines inside a cell sit tighter than the spacing between rows
+            return gap < 0.6 * sorted(self.row_gaps)[len(self.row_gaps) // 2]
+        return False
+
+    def add(self, cells, top=None, bottom=None):
+        test = cells.get("test", "")
+        gap = top - self.last_bottom if top is not None and self.last_bottom is not None else None
+        row = _row(test, cells.get("value", ""), cells.get("unit", ""), cells.get("reference", ""), self.source)
+        if row:
+            if self.pending and (self.pending.endswith(("-", ",", "&", "/")) or self._wraps(row["test"], None)):
+                row["test"] = f"{self.pending} {row['test']}"
+            if gap is not None and not self.pending:
+                self.row_gaps.append(gap)
+            self.rows.append(row)
+            self.pending = None
+            self.last_bottom = bottom
+            return
+        if not test or any(v for role, v in cells.items() if role != "test") or test.lower().startswith(SKIP_PREFIXES):
+            self.pending = None
+            return
+        previous = self.rows[-1]["test"] if self.rows else ""
+        if test.isupper() and not test.startswith("("):
+            # Section heading such as "LIPID PROFILE"
+            self.pending = None
+        elif self.rows and self.last_bottom is not None and (previous.endswith(("-", ",", "&", "/")) or self._wraps(test, gap)):
+            self.rows[-1]["test"] = f"{previous} {test}"
+            self.last_bottom = bottom
+        else:
+            self.pending = f"{self.pending} {test}" if self.pending else test
+            self.last_bottom = None
+
+
+def _table_columns(header):
+    roles = [_phrase_role((cell or "").replace("\n", " ")) for cell in header]
+    return roles if _is_header(roles) else None
+
+
+def table_parse(pages):
+    """Rows from pdfplumber's ruled tables that carry a recognisable header row"""
+    builder = _RowBuilder("table")
+    for page in pages:
+        for table in page.get("tables") or []:
+            roles = None
+            for cells in table:
+                cells = [(cell or "").replace("\n", " ").strip() for cell in cells]
+                if roles is None:
+                    roles = _table_columns(cells)
+                    continue
+                row = {}
+                for role, cell in zip(roles, cells):
+                    if role in ("test", "value", "unit", "reference") and cell:
+                        row[role] = f"{row.get(role, '')} {cell}".strip()
+                builder.add(row)
+    return builder.rows
+
+
+def word_layout_parse(pages):
+    """Rows from word coordinates, using a header row when present and x-clustering otherwise"""
+    page_lines = [_group_lines(page.get("words") or []) for page in pages]
+    columns = None
+    if not any(_header_columns(line) for lines in page_lines for line in lines):
+        columns = _cluster_columns([line for lines in page_lines for line in lines])
+        if columns is None:
+            return []
+        logger.info(f"Layout columns inferred from x positions: {[role for role, _, _ in columns]}")
+
+    builder = _RowBuilder("layout")
+    for lines in page_lines:
+        builder.pending = builder.last_bottom = None
+        for line in lines:
+            if header := _header_columns(line):
+                # Headers usually repeat on every page; the latest one wins
+                columns = header
+                builder.pending = None
+                # The header-to-first-row gap stands in for row spacing until real rows are seen
+                builder.last_bottom = max(w["bottom"] for w in line)
+                continue
+            if columns:
+                top, bottom = min(w["top"] for w in line), max(w["bottom"] for w in line)
+                builder.add(_assign(line, columns), top, bottom)
+    return builder.rows
+
+
+def layout_parse(pages):
+    """Ruled tables first, then word layout; returns [] when neither finds a table"""
+    pages = list(pages)
+    return table_parse(pages) or word_layout_parse(pages)
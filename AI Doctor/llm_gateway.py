@@ -0,0 +1,384 @@
+# llm_gateway.py - one pooled entry point for every LLM call in AI Doctor
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+import metrics
+from llm_async import rate_limiter, retry_after_seconds
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AZURE_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
+MODEL_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "20"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+
+@lru_cache(maxsize=None)
+def retryable_errors():
+    """Errors worth retrying; anything else (bad request, auth, content filter) fails straight away"""
+    # openai and httpx are imported on first use rather than at startup; together they are most of our import time
+    from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+    return (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def _is_rate_limit(error):
+    from openai import RateLimitError
+
+    return isinstance(error, RateLimitError)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the endpoint is considered degraded"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the cool-down ends"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError or let the call through; returns True when the call is the half-open probe"""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._probe_in_flight):
+                raise CircuitOpenError("LLM endpoint is degraded; failing fast")
+            if state == "half-open":
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self, probe):
+        """End a probe whose outcome says nothing about the endpoint (bad request, cancellation)"""
+        if probe:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))
+)
+gemini_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))
+)
+
+
+def _pool_limits():
+    import httpx
+
+    return httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE, keepalive_expiry=60)
+
+
+@lru_cache(maxsize=None)
+def get_http_client():
+    """Keep-alive HTTP pool shared by every sync client"""
+    import httpx
+
+    return httpx.Client(limits=_pool_limits(), timeout=LLM_TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client():
+    """Keep-alive HTTP pool shared by every async client (used only on the llm_async loop)"""
+    import httpx
+
+    return httpx.AsyncClient(limits=_pool_limits(), timeout=LLM_TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    from openai import AzureOpenAI
+
+    # Retries are handled here (jittered backoff + circuit breaker), not by the SDK
+    return AzureOpenAI(
+        api_key=AZURE_API_KEY,
+        azure_endpoint=AZURE_ENDPOINT,
+        api_version=API_VERSION,
+        http_client=get_http_client(),
+        max_retries=0
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_client():
+    from openai import AsyncAzureOpenAI
+
+    return AsyncAzureOpenAI(
+        api_key=AZURE_API_KEY,
+        azure_endpoint=AZURE_ENDPOINT,
+        api_version=API_VERSION,
+        http_client=get_async_http_client(),
+        max_retries=0
+    )
+
+
+@lru_cache(maxsize=None)
+def get_gemini_model(model_name="gemini-1.5-pro"):
+    import google.generativeai as genai
+
+    if not (api_key := os.getenv("GEMINI_API_KEY")):
+        raise RuntimeError("GEMINI_API_KEY is not set; it is needed for Gemini (voice) requests")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def _record_error(error):
+    # A 429 means the endpoint is up but we're over quota; only real failures count toward opening
+    if _is_rate_limit(error):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, never shorter than a server-provided retry-after"""
+    delay = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+    if _is_rate_limit(error):
+        retry_after = retry_after_seconds(error, default=0)
+        if retry_after:
+            rate_limiter.pause(retry_after)
+        delay = max(delay, retry_after)
+    return delay
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Rough token reservation for the rate limiter (~4 characters per token)"""
+    chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return chars // 4 + 1 + (max_tokens or 300)
+
+
+def _request_key(messages, kwargs):
+    payload = json.dumps({"messages": messages, **kwargs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_async_inflight = {}
+
+
+def _call_with_retries(messages, timeout, kwargs, site):
+    client = get_client()
+    reserved = estimate_tokens(messages, kwargs.get("max_tokens"))
+    with metrics.track_call(site) as call:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            call.retries = attempt
+            probe = breaker.before_call()
+            try:
+                rate_limiter.acquire_sync(reserved)
+                response = client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    timeout=timeout,
+                    **kwargs
+                )
+            except retryable_errors() as e:
+                _record_error(e)
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, e)
+                logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Retryable errors settle the probe above; anything else must still free it
+                breaker.release_probe(probe)
+                raise
+            breaker.record_success()
+            call.usage = getattr(response, "usage", None)
+            rate_limiter.refund(reserved, getattr(call.usage, "total_tokens", None))
+            return response
+
+
+def chat(messages, timeout=None, site="chat", **kwargs):
+    """Chat completion through the shared pool, with retries, circuit breaking and coalescing.
+
+    Identical concurrent requests share one upstream call. Raises CircuitOpenError when the
+    endpoint is degraded so callers can return their fallback immediately. `site` tags metrics.
+    """
+    timeout = timeout or LLM_TIMEOUT
+    key = _request_key(messages, kwargs)
+    with _inflight_lock:
+        shared = _inflight.get(key)
+        if shared is None:
+            owner = _inflight[key] = Future()
+    if shared is not None:
+        return shared.result()
+
+    try:
+        response = _call_with_retries(messages, timeout, kwargs, site)
+        owner.set_result(response)
+        return response
+    except BaseException as e:
+        owner.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _tracked_stream(stream, site, started, retries):
+    usage = None
+    try:
+        for chunk in stream:
+            # Only present when the API version supports stream usage reporting
+            usage = getattr(chunk, "usage", None) or usage
+            yield chunk
+    finally:
+        metrics.record_call(site, time.perf_counter() - started, usage, retries)
+
+
+def chat_stream(messages, timeout=None, site="chat_stream", **kwargs):
+    """Streaming chat completion; retries only happen before the stream is opened"""
+    client = get_client()
+    reserved = estimate_tokens(messages, kwargs.get("max_tokens"))
+    started = time.perf_counter()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        probe = breaker.before_call()
+        try:
+            rate_limiter.acquire_sync(reserved)
+            stream = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                timeout=timeout or LLM_TIMEOUT,
+                stream=True,
+                **kwargs
+            )
+        except retryable_errors() as e:
+            _record_error(e)
+            if attempt == LLM_MAX_RETRIES:
+                metrics.record_call(site, time.perf_counter() - started, retries=attempt, error=True)
+                raise
+            time.sleep(backoff_delay(attempt, e))
+            continue
+        except BaseException:
+            breaker.release_probe(probe)
+            metrics.record_call(site, time.perf_counter() - started, retries=attempt, error=True)
+            raise
+        breaker.record_success()
+        return _tracked_stream(stream, site, started, attempt)
+
+
+async def _acall_with_retries(messages, timeout, kwargs, site):
+    client = get_async_client()
+    reserved = estimate_tokens(messages, kwargs.get("max_tokens"))
+    with metrics.track_call(site) as call:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            call.retries = attempt
+            probe = breaker.before_call()
+            try:
+                await rate_limiter.acquire(reserved)
+                response = await client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    timeout=timeout,
+                    **kwargs
+                )
+            except retryable_errors() as e:
+                _record_error(e)
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, e)
+                logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Includes CancelledError: a cancelled probe must not leave the breaker stuck half-open
+                breaker.release_probe(probe)
+                raise
+            breaker.record_success()
+            call.usage = getattr(response, "usage", None)
+            rate_limiter.refund(reserved, getattr(call.usage, "total_tokens", None))
+            return response
+
+
+async def achat(messages, timeout=None, site="chat", **kwargs):
+    """Async chat(); must run on the llm_async loop (use llm_async.run_sync / submit)"""
+    timeout = timeout or LLM_TIMEOUT
+    key = _request_key(messages, kwargs)
+    entry = _async_inflight.get(key)
+    if entry is None:
+        task = asyncio.ensure_future(_acall_with_retries(messages, timeout, kwargs, site))
+        entry = _async_inflight[key] = {"task": task, "waiters": 0}
+        task.add_done_callback(lambda _: _async_inflight.pop(key, None))
+
+    entry["waiters"] += 1
+    try:
+        # Shield so one cancelled waiter doesn't cancel the call other waiters share
+        return await asyncio.shield(entry["task"])
+    except asyncio.CancelledError:
+        if entry["waiters"] == 1:
+            entry["task"].cancel()
+        raise
+    finally:
+        entry["waiters"] -= 1
+
+
+def gemini_generate(prompt, timeout=None, site="gemini"):
+    """Gemini generate_content with a timeout, jittered retries and its own circuit breaker"""
+    model = get_gemini_model()
+    with metrics.track_call(site) as call:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            call.retries = attempt
+            gemini_breaker.before_call()
+            try:
+                response = model.generate_content(prompt, request_options={"timeout": timeout or LLM_TIMEOUT})
+            except Exception as e:
+                gemini_breaker.record_failure()
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"Gemini call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            gemini_breaker.record_success()
+            call.usage = getattr(response, "usage_metadata", None)
+            return response
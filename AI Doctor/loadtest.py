@@ -0,0 +1,189 @@
+# loadtest.py - push synthetic lab reports through the analysis pipeline and report latency
+#
+# Offline by default: starts mock_llm_server in-process and points the Azure client at it.
+#   python loadtest.py --reports 50 --concurrency 8 --params 40 --latency lognormal:-0.7,0.4 --rate-429 0.05
+# Against a real deployment (uses your .env): python loadtest.py --live --reports 5
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# (test name, units, low, high) used to generate realistic rows
+TEST_CATALOGUE = [
+    ("Hemoglobin", "g/dL", 13.0, 17.0), ("Total Leukocyte Count", "thou/mm3", 4.0, 10.0),
+    ("Platelet Count", "thou/mm3", 150, 410), ("RBC Count", "mill/mm3", 4.5, 5.5),
+    ("Hematocrit", "%", 40, 50), ("MCV", "fL", 83, 101), ("MCH", "pg", 27, 32), ("MCHC", "g/dL", 31.5, 34.5),
+    ("Neutrophils", "%", 40, 80), ("Lymphocytes", "%", 20, 40), ("Monocytes", "%", 2, 10), ("Eosinophils", "%", 1, 6),
+    ("Fasting Glucose", "mg/dL", 70, 100), ("HbA1c", "%", 4.0, 5.6), ("Total Cholesterol", "mg/dL", 0, 200),
+    ("Triglycerides", "mg/dL", 0, 150), ("HDL Cholesterol", "mg/dL", 40, 60), ("LDL Cholesterol", "mg/dL", 0, 100),
+    ("VLDL Cholesterol", "mg/dL", 5, 40), ("Creatinine", "mg/dL", 0.7, 1.3), ("Urea", "mg/dL", 13, 43),
+    ("Uric Acid", "mg/dL", 3.5, 7.2), ("Sodium", "mEq/L", 136, 145), ("Potassium", "mEq/L", 3.5, 5.1),
+    ("Chloride", "mEq/L", 98, 107), ("Calcium", "mg/dL", 8.6, 10.3), ("Total Bilirubin", "mg/dL", 0.3, 1.2),
+    ("Direct Bilirubin", "mg/dL", 0.0, 0.2), ("SGOT AST", "U/L", 5, 40), ("SGPT ALT", "U/L", 5, 41),
+    ("Alkaline Phosphatase", "U/L", 40, 129), ("Total Protein", "g/dL", 6.4, 8.3), ("Albumin", "g/dL", 3.5, 5.2),
+    ("TSH", "uIU/mL", 0.27, 4.2), ("Free T4", "ng/dL", 0.93, 1.7), ("Vitamin D", "ng/mL", 30, 100),
+    ("Vitamin B12", "pg/mL", 211, 911), ("Ferritin", "ng/mL", 30, 400), ("Iron", "ug/dL", 65, 175),
+    ("ESR", "mm/hr", 0, 15),
+]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(page_streams):
+    """Minimal PDF (no dependencies) from one content stream per page, using Helvetica as /F1"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for stream in page_streams or [""]:
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+def build_pdf(lines, lines_per_page=55):
+    """Text-only PDF that pdfplumber extracts line by line"""
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    return write_pdf([
+        "BT /F1 10 Tf 14 TL 40 800 Td\n" + "".join(f"({_escape(line)}) Tj T*\n" for line in page_lines) + "ET"
+        for page_lines in pages
+    ])
+
+
+def synthetic_report(n_params, seed):
+    """PDF bytes for a lab report in the format standard_parse expects"""
+    rng = random.Random(seed)
+    lines = ["CITY DIAGNOSTICS LABORATORY", f"Patient ID: SYN-{seed:05d}", "Sample Type: Blood",
+             "TEST NAME OBSERVED VALUE UNITS BIO. REF. INTERVAL", "COMPLETE BLOOD COUNT"]
+    for i in range(n_params):
+        name, units, low, high = TEST_CATALOGUE[i % len(TEST_CATALOGUE)]
+        if i >= len(TEST_CATALOGUE):
+            name = f"{name} Repeat {i // len(TEST_CATALOGUE)}"
+        span = high - low
+        value = rng.uniform(low - 0.3 * span, high + 0.3 * span) if low else rng.uniform(0.5 * high, 1.3 * high)
+        reference = f"<{high:g}" if not low else f"{low:g} - {high:g}"
+        lines.append(f"{name} {max(value, 0):.1f} {units} {reference}")
+    lines.append("Disclaimer: synthetic report generated for load testing")
+    return build_pdf(lines)
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+
+def run_report(pdf_bytes, mode):
+    """Process one report end to end; returns (seconds, parameter_count)"""
+    from pdfhandle import parse_medical_pdf
+    from analyze import analyze_parameter, analyze_parameters, analyze_parameters_concurrently, generate_report_summary
+    from report_pipeline import start_report_analysis
+
+    started = time.perf_counter()
+    if mode == "pipeline":
+        run = start_report_analysis(io.BytesIO(pdf_bytes))
+        for _ in run.events():
+            pass
+        count = len(run.result("parse") or [])
+    else:
+        raw_data = parse_medical_pdf(io.BytesIO(pdf_bytes))
+        if mode == "serial":
+            [analyze_parameter(item["test"], item["value"], item["reference"]) for item in raw_data]
+        elif mode == "concurrent":
+            analyze_parameters_concurrently(raw_data)
+        else:
+            analyze_parameters(raw_data)
+        generate_report_summary(raw_data)
+        count = len(raw_data)
+    return time.perf_counter() - started, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test parse -> analyze -> summary on synthetic PDFs")
+    parser.add_argument("--reports", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--params", type=int, default=40, help="Parameters per synthetic report")
+    parser.add_argument("--mode", choices=["pipeline", "batch", "concurrent", "serial"], default="pipeline")
+    parser.add_argument("--latency", default="lognormal:-0.7,0.4", help="Mock latency distribution (see mock_llm_server)")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--live", action="store_true", help="Use the real endpoint from the environment")
+    parser.add_argument("--keep-cache", action="store_true", help="Reuse the analysis cache between runs")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    if not args.live:
+        from mock_llm_server import start_mock_server
+        server, url = start_mock_server(latency=args.latency, rate_429=args.rate_429)
+        os.environ.update({"AZURE_OPENAI_ENDPOINT": url, "AZURE_OPENAI_API_KEY": "mock",
+                           "AZURE_OPENAI_DEPLOYMENT_NAME": "mock"})
+    if not args.keep_cache:
+        # Fresh cache so every run measures real LLM traffic
+        os.environ["ANALYSIS_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "analysis_cache.sqlite3")
+
+    import metrics
+
+    reports = [synthetic_report(args.params, seed) for seed in range(args.reports)]
+    latencies, errors, parameters = [], 0, 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_report, pdf, args.mode) for pdf in reports]
+        for future in futures:
+            try:
+                seconds, count = future.result()
+                latencies.append(seconds)
+                parameters += count
+            except Exception as e:
+                errors += 1
+                print(f"Report failed: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    exported = metrics.render_prometheus()
+    fallbacks = sum(float(line.rsplit(" ", 1)[1]) for line in exported.splitlines() if line.startswith("llm_fallbacks_total"))
+    summary = {
+        "mode": args.mode,
+        "reports": args.reports,
+        "concurrency": args.concurrency,
+        "parameters": parameters,
+        "elapsed_seconds": round(elapsed, 3),
+        "reports_per_minute": round(len(latencies) / elapsed * 60, 1) if elapsed else 0.0,
+        "latency_p50": round(_percentile(latencies, 50), 3),
+        "latency_p95": round(_percentile(latencies, 95), 3),
+        "latency_p99": round(_percentile(latencies, 99), 3),
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "error_rate": round(errors / args.reports, 4) if args.reports else 0.0,
+        "fallback_activations": int(fallbacks),
+    }
+    if not args.live:
+        summary["mock_requests"] = server.RequestHandlerClass.state.requests
+        summary["mock_429s"] = server.RequestHandlerClass.state.throttled
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for key, value in summary.items():
+            print(f"{key:>22}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# metrics.py - latency, token, retry, cache and fallback metrics for LLM calls
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+SAMPLES_PER_SITE = 2000
+REPORTS_KEPT = 200
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_SITE))
+_reports = OrderedDict()
+_current_report = contextvars.ContextVar("current_report", default=None)
+
+
+class ReportMetrics:
+    """Per-report accumulation of everything recorded while the report is being processed"""
+
+    def __init__(self, report_id):
+        self.report_id = report_id
+        self.started = time.time()
+        self.sites = defaultdict(lambda: {
+            "calls": 0, "latency_seconds": 0.0, "prompt_tokens": 0,
+            "completion_tokens": 0, "retries": 0, "errors": 0, "fallbacks": 0
+        })
+        self.cache = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self.stages = {}
+        self.extractor = None
+        self._lock = threading.Lock()
+
+    def breakdown(self):
+        with self._lock:
+            sites = {site: dict(values) for site, values in self.sites.items()}
+            totals = {
+                key: sum(values[key] for values in sites.values())
+                for key in ("calls", "latency_seconds", "prompt_tokens", "completion_tokens", "retries", "fallbacks")
+            }
+            return {
+                "report_id": self.report_id,
+                "started": self.started,
+                "totals": totals,
+                "sites": sites,
+                "cache": {name: dict(values) for name, values in self.cache.items()},
+                "stages": dict(self.stages),
+                "extractor": self.extractor
+            }
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def _inc(name, amount=1, **labels):
+    _counters[(name, _labels(**labels))] += amount
+
+
+@contextmanager
+def report_scope(report_id=None):
+    """Attribute every metric recorded inside the block (and in pipeline stages it starts) to one report"""
+    report = ReportMetrics(report_id or uuid.uuid4().hex[:12])
+    with _lock:
+        _reports[report.report_id] = report
+        while len(_reports) > REPORTS_KEPT:
+            _reports.popitem(last=False)
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+
+def record_call(site, latency, usage=None, retries=0, error=False):
+    """Record one LLM call; `usage` is the response's usage object or an equivalent dict"""
+    prompt_tokens = _usage_value(usage, "prompt_tokens", "prompt_token_count")
+    completion_tokens = _usage_value(usage, "completion_tokens", "candidates_token_count")
+
+    with _lock:
+        _inc("llm_calls_total", site=site, outcome="error" if error else "ok")
+        _inc("llm_retries_total", retries, site=site)
+        _inc("llm_tokens_total", prompt_tokens, site=site, kind="prompt")
+        _inc("llm_tokens_total", completion_tokens, site=site, kind="completion")
+        buckets = _histograms.setdefault(site, [0] * len(LATENCY_BUCKETS))
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                buckets[i] += 1
+        _inc("llm_latency_seconds_sum", latency, site=site)
+        _inc("llm_latency_seconds_count", 1, site=site)
+        _samples[site].append(latency)
+
+    if report := _current_report.get():
+        with report._lock:
+            values = report.sites[site]
+            values["calls"] += 1
+            values["latency_seconds"] += latency
+            values["prompt_tokens"] += prompt_tokens
+            values["completion_tokens"] += completion_tokens
+            values["retries"] += retries
+            values["errors"] += int(error)
+
+
+def _usage_value(usage, *names):
+    for name in names:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        if isinstance(value, (int, float)):
+            return value
+    return 0
+
+
+def record_cache(cache, hit):
+    with _lock:
+        _inc("cache_hits_total" if hit else "cache_misses_total", cache=cache)
+    if report := _current_report.get():
+        with report._lock:
+            report.cache[cache]["hits" if hit else "misses"] += 1
+
+
+def record_fallback(site):
+    """Count a call site returning its canned fallback instead of a model answer"""
+    with _lock:
+        _inc("llm_fallbacks_total", site=site)
+    if report := _current_report.get():
+        with report._lock:
+            report.sites[site]["fallbacks"] += 1
+
+
+def record_parse(extractor):
+    """Count which extractor produced a report's rows ("regex", "table", "layout", "ai" or "none")"""
+    with _lock:
+        _inc("pdf_parses_total", extractor=extractor)
+    if report := _current_report.get():
+        with report._lock:
+            report.extractor = extractor
+
+
+def record_stage(stage, seconds):
+    if report := _current_report.get():
+        with report._lock:
+            report.stages[stage] = round(seconds, 4)
+
+
+@contextmanager
+def track_call(site):
+    """Time a block as one call; set `call.usage` / `call.retries` inside the block when known"""
+    call = type("Call", (), {"usage": None, "retries": 0})()
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        record_call(site, time.perf_counter() - started, call.usage, call.retries, error=True)
+        raise
+    record_call(site, time.perf_counter() - started, call.usage, call.retries)
+
+
+def percentiles(site, points=(50, 95, 99)):
+    with _lock:
+        samples = sorted(_samples.get(site, ()))
+    if not samples:
+        return {}
+    return {f"p{p}": samples[min(len(samples) - 1, int(len(samples) * p / 100))] for p in points}
+
+
+def report_breakdown(report_id):
+    with _lock:
+        report = _reports.get(report_id)
+    return report.breakdown() if report else None
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def render_prometheus():
+    """Prometheus text exposition of every metric"""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {site: list(buckets) for site, buckets in _histograms.items()}
+        sites = list(_samples)
+
+    for name in sorted({name for name, _ in counters}):
+        if not name.startswith("llm_latency_seconds"):
+            lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name and not name.startswith("llm_latency_seconds"):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    lines.append("# TYPE llm_latency_seconds histogram")
+    for site, buckets in sorted(histograms.items()):
+        for bound, count in zip(LATENCY_BUCKETS, buckets):
+            lines.append(f'llm_latency_seconds_bucket{{le="{bound}",site="{site}"}} {count}')
+        total = counters.get(("llm_latency_seconds_count", _labels(site=site)), 0)
+        lines.append(f'llm_latency_seconds_bucket{{le="+Inf",site="{site}"}} {total:g}')
+        lines.append(f'llm_latency_seconds_sum{{site="{site}"}} {counters.get(("llm_latency_seconds_sum", _labels(site=site)), 0):g}')
+        lines.append(f'llm_latency_seconds_count{{site="{site}"}} {total:g}')
+
+    lines.append("# TYPE llm_latency_seconds_quantile gauge")
+    for site in sorted(sites):
+        for name, value in percentiles(site).items():
+            quantile = int(name[1:]) / 100
+            lines.append(f'llm_latency_seconds_quantile{{quantile="{quantile}",site="{site}"}} {value:.4f}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = render_prometheus(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/reports/") and (breakdown := report_breakdown(self.path.split("/")[-1])):
+            body, content_type = json.dumps(breakdown, indent=2), "application/json"
+        elif self.path == "/reports":
+            with _lock:
+                body, content_type = json.dumps(list(_reports)), "application/json"
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port):
+    """Serve /metrics (Prometheus) and /reports/<id> (JSON) from a daemon thread; safe to call on every rerun"""
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {port}: {e}")
+            return None
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics server listening on port {port}")
+    return _server
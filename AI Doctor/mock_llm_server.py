@@ -0,0 +1,212 @@
+# mock_llm_server.py - offline OpenAI/Azure-compatible stand-in for benchmarking
+#
+# Run:   python mock_llm_server.py --port 8011 --latency lognormal:-0.5,0.4 --rate-429 0.05
+# Then:  AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8011 AZURE_OPENAI_API_KEY=mock \
+#        AZURE_OPENAI_DEPLOYMENT_NAME=mock streamlit run app.py   (or python loadtest.py)
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CANNED_ANALYSIS = {
+    "Good": ("Value is within the healthy reference range", "Spinach, lentils, almonds", "30-min daily brisk walking"),
+    "Moderate": ("Value is close to the reference limit and worth monitoring", "Oats, walnuts, olive oil", "40-min walking 5 days a week"),
+    "Immediate Attention": ("Value is well outside the reference range; consult a doctor", "Leafy greens, beans, berries", "Consult doctor before exercising"),
+}
+
+CANNED_SUMMARY = (
+    "Overall, most of your test results are within the normal range. A few values are slightly "
+    "outside their reference limits and are worth discussing with your doctor. Keep a balanced "
+    "diet, stay active with regular walks, and recheck the flagged parameters in three months."
+)
+
+CANNED_VOICE_ANSWER = (
+    "Don't worry, most of your results are within the normal range. You can improve this by walking "
+    "30 minutes a day and rechecking in 3 months."
+)
+CANNED_TAMIL_ANSWER = (
+    "கவலைப்பட வேண்டாம், உங்கள் பெரும்பாலான முடிவுகள் இயல்பான வரம்பில் உள்ளன. தினமும் 30 நிமிடம் "
+    "நடப்பதன் மூலம் இதை மேம்படுத்த முடியும், 3 மாதங்களில் மீண்டும் பரிசோதிக்கவும்."
+)
+
+batch_line_pattern = re.compile(r'^\s*(\d+)\.\s+Test:.*?(?:\|\s*Status:\s*(.+?))?\s*$', re.MULTILINE)
+row_pattern = re.compile(r'^(?P<test>[A-Za-z][A-Za-z0-9 ,()/.-]+?)\s+(?P<value>\d+\.?\d*)\s+(?P<units>\S+)\s+(?P<ref>.+)$', re.MULTILINE)
+
+
+def parse_latency(spec):
+    """Build a latency sampler from "const:S", "uniform:A,B", "normal:MU,SIGMA" or "lognormal:MU,SIGMA" """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    samplers = {
+        "const": lambda: values[0],
+        "uniform": lambda: random.uniform(values[0], values[1]),
+        "normal": lambda: max(0.0, random.gauss(values[0], values[1])),
+        "lognormal": lambda: random.lognormvariate(values[0], values[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return samplers[kind]
+
+
+def _analysis(status):
+    reason, food, exercise = CANNED_ANALYSIS.get(status, CANNED_ANALYSIS["Good"])
+    return {"status": status if status in CANNED_ANALYSIS else "Good", "reason": reason, "food": food, "exercise": exercise}
+
+
+def canned_reply(body):
+    """Pick a plausible response for the prompt shapes used by analyze.py and pdfhandle.py"""
+    prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+    json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+
+    if '"results"' in prompt and (lines := batch_line_pattern.findall(prompt)):
+        return json.dumps({"results": [
+            {"id": int(index), **_analysis(status or random.choice(list(CANNED_ANALYSIS)))}
+            for index, status in lines
+        ]})
+    if '"parameters"' in prompt:
+        # ai_based_parse extraction prompt: pull rows out of the embedded report text
+        parameters = [
+            {"test": m["test"].strip(), "value": m["value"], "reference": f"{m['ref'].strip()} {m['units']}"}
+            for m in row_pattern.finditer(prompt.split("Medical Report Text:")[-1].split("Extract each test")[0])
+        ]
+        return json.dumps({"parameters": parameters})
+    if '"tamil_answer"' in prompt:
+        # voice.answer_in_one_pass: question echoed with its numbers, answer in both languages
+        question = re.search(r'question \(Tamil\):\s*(.+)', prompt)
+        numbers = " ".join(re.findall(r'\d+\.?\d*', question.group(1) if question else ""))
+        return json.dumps({"english_question": f"How is my report? {numbers}".strip(),
+                           "english_answer": CANNED_VOICE_ANSWER, "tamil_answer": CANNED_TAMIL_ANSWER},
+                          ensure_ascii=False)
+    if "User's question:" in prompt:
+        return CANNED_VOICE_ANSWER
+    if json_mode:
+        status = re.search(r'Status:\s*(Good|Moderate|Immediate Attention)', prompt)
+        return json.dumps(_analysis(status.group(1) if status else random.choice(list(CANNED_ANALYSIS))))
+    return CANNED_SUMMARY
+
+
+class MockState:
+    def __init__(self, latency, rate_429, retry_after, stream_chunk_delay):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.stream_chunk_delay = stream_chunk_delay
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def do_POST(self):
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.state.lock:
+            self.state.requests += 1
+            throttle = random.random() < self.state.rate_429
+            if throttle:
+                self.state.throttled += 1
+
+        if throttle:
+            self._send_json(429, {"error": {"code": "429", "message": "Rate limit exceeded (mock)"}},
+                            {"retry-after": str(self.state.retry_after)})
+            return
+
+        time.sleep(self.state.latency())
+        content = canned_reply(body)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                 "total_tokens": prompt_tokens + len(content) // 4}
+
+        if body.get("stream"):
+            self._send_stream(content, body)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage
+            })
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "mock")}
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word + (" " if i < len(words) - 1 else "")}
+            self._write_chunk(f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n")
+            time.sleep(self.state.stream_chunk_delay)
+        self._write_chunk(f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port=0, latency="const:0.2", rate_429=0.0, retry_after=1, stream_chunk_delay=0.02):
+    """Start the mock server in a daemon thread; returns (server, base_url)"""
+    handler = type("BoundMockHandler", (MockHandler,), {
+        "state": MockState(parse_latency(latency), rate_429, retry_after, stream_chunk_delay)
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Azure OpenAI-compatible mock for load testing")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency", default="lognormal:-0.5,0.4",
+                        help='const:S | uniform:A,B | normal:MU,SIGMA | lognormal:MU,SIGMA (seconds)')
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="retry-after header sent with 429s")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.02, help="Seconds between streamed words")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.port, args.latency, args.rate_429, args.retry_after, args.stream_chunk_delay)
+    print(f"Mock LLM listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# parse_eval.py - how often each extractor handles a report, and how often we still fall back to the LLM
+#
+# Synthetic corpus (one PDF per layout per seed, with ground truth):
+#   python parse_eval.py --seeds 5
+# Your own PDFs (no ground truth; reports extractor shares only):
+#   python parse_eval.py --corpus path/to/pdfs
+import argparse
+import json
+import logging
+import os
+import random
+from collections import Counter
+
+from loadtest import TEST_CATALOGUE, _escape, build_pdf, write_pdf
+
+PAGE_TOP = 800
+ROWS_PER_PAGE = 40
+
+
+def _cells(x, y, texts):
+    return "".join(f"BT /F1 9 Tf {cx} {y} Td ({_escape(text)}) Tj ET\n" for cx, text in zip(x, texts) if text)
+
+
+def _rows(n_params, seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_params):
+        name, units, low, high = TEST_CATALOGUE[(i + seed) % len(TEST_CATALOGUE)]
+        span = high - low
+        value = max(rng.uniform(low - 0.3 * span, high + 0.3 * span), 0)
+        reference = f"<{high:g}" if not low else f"{low:g} - {high:g}"
+        rows.append((name, f"{value:.1f}", units, reference))
+    return rows
+
+
+def positioned_report(rows, header, x, pitch=16, wrap=None, rules=False, title="CITY DIAGNOSTICS LABORATORY"):
+    """Lab report with cells placed at fixed x positions; `wrap` splits long names onto a tighter second line"""
+    streams = []
+    for start in range(0, len(rows), ROWS_PER_PAGE):
+        y = PAGE_TOP
+        stream = f"BT /F1 11 Tf 40 {y} Td ({_escape(title)}) Tj ET\n"
+        y -= 30
+        row_edges = [y + pitch - 4]
+        if header:
+            stream += _cells(x, y, header)
+            y -= pitch
+            row_edges.append(y + pitch - 4)
+        for name, value, units, reference in rows[start:start + ROWS_PER_PAGE]:
+            lines = [name]
+            if wrap and len(name) > wrap and " " in name:
+                cut = name.rfind(" ", 0, wrap + 1)
+                cut = cut if cut > 0 else name.find(" ")
+                lines = [name[:cut], name[cut + 1:]]
+            stream += _cells(x, y, [lines[0], value, units, reference][:len(x)])
+            for extra in lines[1:]:
+                y -= 10
+                stream += _cells(x[:1], y, [extra])
+            y -= pitch
+            row_edges.append(y + pitch - 4)
+        if rules:
+            right = 555
+            stream += "0.5 w\n" + "".join(f"36 {edge} m {right} {edge} l S\n" for edge in row_edges)
+            stream += "".join(f"{edge} {row_edges[-1]} m {edge} {row_edges[0]} l S\n"
+                              for edge in [36] + [cx - 4 for cx in x[1:]] + [right])
+        stream += "BT /F1 8 Tf 40 40 Td (Disclaimer: results relate only to the sample tested) Tj ET\n"
+        streams.append(stream)
+    return write_pdf(streams)
+
+
+def narrative_report(rows):
+    lines = [f"Your {name.lower()} was {value} {units}; the usual range is {reference}." for name, value, units, reference in rows]
+    return write_pdf(["BT /F1 10 Tf 14 TL 40 800 Td\n" + "".join(f"({_escape(line)}) Tj T*\n" for line in lines) + "ET"])
+
+
+LAYOUTS = {
+    "standard_header": lambda rows, seed: build_pdf(
+        ["CITY DIAGNOSTICS LABORATORY", "TEST NAME OBSERVED VALUE UNITS BIO. REF. INTERVAL"]
+        + [" ".join(row) for row in rows]),
+    "synonym_header": lambda rows, seed: positioned_report(
+        rows, ["Investigation", "Result", "Unit", "Biological Reference Interval"], [40, 230, 300, 380]),
+    "no_header": lambda rows, seed: positioned_report(rows, None, [40, 240, 310, 400]),
+    "wrapped_names": lambda rows, seed: positioned_report(
+        rows, ["Test Description", "Value", "Units", "Normal Range"], [40, 170, 240, 330], pitch=22, wrap=14),
+    "ruled_table": lambda rows, seed: positioned_report(
+        rows, ["Parameter", "Observed Value", "UOM", "Reference Range"], [40, 230, 320, 400], pitch=18, rules=True),
+    "narrative": lambda rows, seed: narrative_report(rows),
+}
+
+
+def extract(pdf_file):
+    """Run the deterministic extractors in production order; returns (extractor, rows)"""
+    from pdfhandle import PdfDocument, standard_parse
+    from layout_parse import layout_parse
+
+    document = PdfDocument(pdf_file)
+    if rows := standard_parse(document):
+        return "regex", rows
+    if rows := layout_parse(document.iter_pages_with_tables()):
+        return rows[0]["source"], rows
+    return "ai", []
+
+
+def _score(rows, expected):
+    found = {(row["test"].lower(), float(row["value"])) for row in rows}
+    truth = {(name.lower(), float(value)) for name, value, _, _ in expected}
+    hits = len(found & truth)
+    return hits / len(truth) if truth else 0.0, hits / len(found) if found else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure LLM fallback rate of the PDF extractors")
+    parser.add_argument("--seeds", type=int, default=3, help="Synthetic reports per layout")
+    parser.add_argument("--params", type=int, default=30)
+    parser.add_argument("--corpus", help="Directory of real PDFs to evaluate instead of the synthetic corpus")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    results = []
+    if args.corpus:
+        for name in sorted(os.listdir(args.corpus)):
+            if name.lower().endswith(".pdf"):
+                extractor, rows = extract(os.path.join(args.corpus, name))
+                results.append({"layout": name, "extractor": extractor, "rows": len(rows)})
+    else:
+        for layout, build in LAYOUTS.items():
+            for seed in range(args.seeds):
+                expected = _rows(args.params, seed)
+                extractor, rows = extract(build(expected, seed))
+                recall, precision = _score(rows, expected)
+                results.append({"layout": layout, "extractor": extractor, "rows": len(rows),
+                                "recall": round(recall, 3), "precision": round(precision, 3)})
+
+    total = len(results)
+    shares = Counter(result["extractor"] for result in results)
+    summary = {
+        "reports": total,
+        "extractors": dict(shares),
+        "llm_fallback_rate": round(shares["ai"] / total, 3) if total else 0.0,
+        # What the rate would be with the header regex alone, before the layout extractor existed
+        "regex_only_fallback_rate": round(1 - shares["regex"] / total, 3) if total else 0.0,
+    }
+    if args.json:
+        print(json.dumps({"summary": summary, "reports": results}, indent=2))
+        return
+    for result in results:
+        scores = f"  recall {result['recall']:.2f}  precision {result['precision']:.2f}" if "recall" in result else ""
+        print(f"{result['layout']:<24} {result['extractor']:<7} {result['rows']:>4} rows{scores}")
+    print()
+    for key, value in summary.items():
+        print(f"{key:>26}: {value}")
+
+
+if __name__ == "__main__":
+    main()
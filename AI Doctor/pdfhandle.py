@@ -1,12 +1,19 @@
 # pdfhandle.py (Enhanced with AI fallback)
 import pdfplumber
+import asyncio
+import io
+import os
 import re
 import logging
-import os
-from langchain_community.chat_models import AzureChatOpenAI
-#from langchain.chat_models import AzureChatOpenAI
-from langchain.schema import HumanMessage
-from langchain.output_parsers import PydanticOutputParser
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from llm_async import submit
+from llm_gateway import achat, CircuitOpenError
+from cache import normalize_text
+from layout_parse import layout_parse
+import metrics
 from pydantic import BaseModel, Field
 from typing import List
 
@@ -21,21 +28,231 @@ class MedicalParameter(BaseModel):
 class MedicalReport(BaseModel):
     parameters: List[MedicalParameter] = Field(description="List of medical parameters from the report")
 
+# Documents with at least this many pages are extracted in a process pool, a page range per task
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+WORD_KEYS = ("text", "x0", "x1", "top", "bottom")
+
+# AI fallback: prompt size per chunk and how many times a failed chunk is asked again
+AI_PARSE_CHUNK_TOKENS = int(os.getenv("AI_PARSE_CHUNK_TOKENS", "2000"))
+AI_PARSE_MAX_RETRIES = int(os.getenv("AI_PARSE_MAX_RETRIES", "2"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: this process already runs the LLM event-loop thread, HTTP pools and Streamlit
+            # threads, whose locks a forked child could inherit mid-use
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _extract_page(page):
+    # Ruled tables are left out: only the layout fallback reads them (see PdfDocument.iter_pages_with_tables)
+    words = [{key: word[key] for key in WORD_KEYS} for word in page.extract_words()]
+    extracted = {"number": page.page_number, "text": page.extract_text() or "", "words": words}
+    # pdfplumber keeps every parsed page object alive otherwise; we only need the plain extract
+    page.flush_cache()
+    return extracted
+
+
+def _extract_range(data, start, stop):
+    """Process-pool worker: extract pages [start, stop) from the raw PDF bytes"""
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return [_extract_page(page) for page in pdf.pages[start:stop]]
+
+
+class PdfDocument:
+    """A PDF read and extracted once (text, words); pages are produced lazily and shared by every parser"""
+
+    def __init__(self, pdf_file):
+        if isinstance(pdf_file, (bytes, bytearray)):
+            self.data = bytes(pdf_file)
+        elif isinstance(pdf_file, (str, os.PathLike)):
+            with open(pdf_file, "rb") as f:
+                self.data = f.read()
+        else:
+            pdf_file.seek(0)
+            self.data = pdf_file.read()
+        with pdfplumber.open(io.BytesIO(self.data)) as pdf:
+            self.page_count = len(pdf.pages)
+        self._pages = []
+        self._released = 0
+        self._keep_pages = True
+        self._source = None
+        self._lock = threading.Lock()
+
+    def _extract_serial(self):
+        with pdfplumber.open(io.BytesIO(self.data)) as pdf:
+            for page in pdf.pages:
+                yield _extract_page(page)
+
+    def _extract_parallel(self):
+        # Later ranges go to the pool; the first is extracted here so page 1 is not held up by worker start-up
+        futures = [
+            _get_pool().submit(_extract_range, self.data, start, min(start + PAGES_PER_TASK, self.page_count))
+            for start in range(PAGES_PER_TASK, self.page_count, PAGES_PER_TASK)
+        ]
+        try:
+            with pdfplumber.open(io.BytesIO(self.data)) as pdf:
+                for page in pdf.pages[:PAGES_PER_TASK]:
+                    yield _extract_page(page)
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _extract(self):
+        if self.page_count < PARALLEL_MIN_PAGES or EXTRACT_WORKERS < 2:
+            yield from self._extract_serial()
+            return
+        done = 0
+        try:
+            for page in self._extract_parallel():
+                done += 1
+                yield page
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning(f"Parallel PDF extraction failed ({e}); continuing in-process")
+            for page in self._extract_serial():
+                if page["number"] > done:
+                    yield page
+
+    def iter_pages(self):
+        """Yield page dicts (number, text, words) in order, extracting only as far as the caller reads"""
+        index = 0
+        while True:
+            with self._lock:
+                position = index - self._released
+                if position < 0:
+                    raise RuntimeError("PDF pages were released before this reader got to them")
+                if position < len(self._pages):
+                    page = self._pages[position]
+                else:
+                    if self._source is None:
+                        self._source = self._extract()
+                    page = next(self._source, None)
+                    if page is None:
+                        return
+                    if self._keep_pages:
+                        self._pages.append(page)
+                    else:
+                        self._released += 1
+            index += 1
+            yield page
+
+    def iter_pages_with_tables(self):
+        """iter_pages() plus each page's ruled tables, found in a second pass so the regex path never pays for them"""
+        with pdfplumber.open(io.BytesIO(self.data)) as pdf:
+            for page in self.iter_pages():
+                if "tables" not in page:
+                    plumber_page = pdf.pages[page["number"] - 1]
+                    page["tables"] = plumber_page.extract_tables()
+                    plumber_page.flush_cache()
+                yield page
+
+    def release(self):
+        """Stop keeping pages for later readers so memory stays flat; only the current reader may continue"""
+        with self._lock:
+            self._released += len(self._pages)
+            self._pages = []
+            self._keep_pages = False
+
+    @property
+    def text(self):
+        return "\n".join(page["text"] for page in self.iter_pages())
+
+    def lines(self):
+        for page in self.iter_pages():
+            for line in page["text"].split("\n"):
+                if line.strip():
+                    yield line.strip()
+
+
+class ExtractedText:
+    """Page texts extracted elsewhere (e.g. in a batch worker process), read by ai_based_parse like a PdfDocument"""
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+
+    def iter_pages(self):
+        for number, text in enumerate(self.texts, 1):
+            yield {"number": number, "text": text, "words": []}
+
+
 def parse_medical_pdf(pdf_file):
     """Enhanced PDF parser with AI fallback for medical reports"""
+    return list(iter_medical_pdf(pdf_file))
+
+def iter_medical_pdf(pdf_file):
+    """Yield {test, value, reference, source} rows as soon as they are parsed.
+
+    Regex rows stream out line by line while later pages are still being extracted. The
+    layout and AI fallbacks need the whole document, so their rows arrive together at the end.
+    """
+    # Extract once; every parser reads the same pages
+    document = PdfDocument(pdf_file)
+    found = False
+    for row in iter_local_parse(document):
+        found = True
+        yield row
+    if found:
+        return
+
+    # Only if neither finds a table, try AI-based parsing
+    logger.info("Layout parsing yielded no results. Trying AI-based parsing...")
+    results = ai_based_parse(document)
+    metrics.record_parse(results[0]["source"] if results else "none")
+    yield from results
+
+def iter_local_parse(pdf_file):
+    """iter_medical_pdf without the AI fallback: regex rows, else layout rows, else nothing"""
+    document = pdf_file if isinstance(pdf_file, PdfDocument) else PdfDocument(pdf_file)
+
     # First attempt with regex-based parsing
-    results = standard_parse(pdf_file)
-    
-    # If standard parsing yields no results, try AI-based parsing
-    if not results:
-        logger.info("Standard parsing yielded no results. Trying AI-based parsing...")
-        results = ai_based_parse(pdf_file)
+    found = 0
+    for row in iter_standard_parse(document):
+        if not found:
+            # The fallbacks won't run, so pages need not be kept once they are parsed
+            document.release()
+        found += 1
+        yield row
+    if found:
+        metrics.record_parse("regex")
+        return
     
-    return results
+    # Then the layout extractor (ruled tables, header synonyms or column positions)
+    logger.info("Standard parsing yielded no results. Trying layout-based parsing...")
+    results = layout_parse(document.iter_pages_with_tables())
+    if results:
+        metrics.record_parse(results[0]["source"])
+    yield from results
+
+async def aiter_medical_pdf(pdf_file):
+    """Async variant of iter_medical_pdf; parsing runs in a worker thread so the event loop stays free"""
+    rows = iter_medical_pdf(pdf_file)
+    done = object()
+    try:
+        while (row := await asyncio.to_thread(next, rows, done)) is not done:
+            yield row
+    finally:
+        try:
+            rows.close()
+        except ValueError:
+            # Cancelled while a worker thread is still inside next(); it finishes on its own
+            pass
 
 def standard_parse(pdf_file):
     """Standard regex-based parsing method"""
-    results = []
+    return list(iter_standard_parse(pdf_file))
+
+def iter_standard_parse(pdf_file):
+    """Regex-based parsing, yielding each row as its line matches"""
     header_found = False
     header_pattern = re.compile(
         r'TEST\s+NAME\s+OBSERVED\s+VALUE\s+UNITS\s+BIO\.?\s+REF\.?\s*INTERVAL',
@@ -50,68 +267,66 @@ def standard_parse(pdf_file):
         r'(?P<ref>.+)$'               # Reference range
     )
 
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-            
-            for line in lines:
-                # Skip disclaimers and empty lines
-                if not line or line.startswith('Disclaimer'):
-                    continue
-                
-                # Detect header row
-                if header_pattern.search(line):
-                    header_found = True
-                    logger.info(f"Header found: {line}")
-                    continue
-                
-                if header_found:
-                    # Skip section headers (all caps without numbers)
-                    if re.match(r'^[A-Z\s/]+$', line) and not re.search(r'\d', line):
-                        logger.debug(f"Skipping section: {line}")
-                        continue
-                    
-                    # Extract data using regex
-                    if match := data_pattern.match(line):
-                        data = match.groupdict()
-                        results.append({
-                            "test": data['test'].strip(),
-                            "value": data['value'],
-                            "reference": f"{data['ref']} {data['units']}".strip()
-                        })
-                        logger.info(f"Valid row: {data}")
-                    else:
-                        logger.debug(f"Skipped line: {line}")
-    
-    return results
-
-def ai_based_parse(pdf_file):
-    """AI-based parsing using LangChain and Azure OpenAI"""
-    try:
-        # Configure Azure OpenAI client
-        llm = AzureChatOpenAI(
-            openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
-            azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-            openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-        
-        # Extract text from PDF
-        full_text = ""
-        with pdfplumber.open(pdf_file) as pdf:
-            for page in pdf.pages:
-                full_text += page.extract_text() + "\n"
+    document = pdf_file if isinstance(pdf_file, PdfDocument) else PdfDocument(pdf_file)
+    for line in document.lines():
+        # Skip disclaimers and empty lines
+        if not line or line.startswith('Disclaimer'):
+            continue
         
-        # Define the output parser
-        parser = PydanticOutputParser(pydantic_object=MedicalReport)
+        # Detect header row
+        if header_pattern.search(line):
+            header_found = True
+            logger.info(f"Header found: {line}")
+            continue
         
-        # Create the prompt
-        prompt = f"""
+        if header_found:
+            # Skip section headers (all caps without numbers)
+            if re.match(r'^[A-Z\s/]+$', line) and not re.search(r'\d', line):
+                logger.debug(f"Skipping section: {line}")
+                continue
+            
+            # Extract data using regex
+            if match := data_pattern.match(line):
+                data = match.groupdict()
+                logger.info(f"Valid row: {data}")
+                yield {
+                    "test": data['test'].strip(),
+                    "value": data['value'],
+                    "reference": f"{data['ref']} {data['units']}".strip(),
+                    "source": "regex"
+                }
+            else:
+                logger.debug(f"Skipped line: {line}")
+
+def _chunk_texts(document, budget_chars):
+    """Group pages into chunks of roughly budget_chars, splitting oversized pages on line boundaries"""
+    chunk = ""
+    for page in document.iter_pages():
+        pieces = [page["text"]]
+        if len(page["text"]) > budget_chars:
+            pieces, piece = [], ""
+            for line in page["text"].split("\n"):
+                if piece and len(piece) + len(line) > budget_chars:
+                    pieces.append(piece)
+                    piece = ""
+                piece += line + "\n"
+            pieces.append(piece)
+        for piece in pieces:
+            if chunk and len(chunk) + len(piece) > budget_chars:
+                yield chunk
+                chunk = ""
+            chunk += piece + "\n"
+    if chunk.strip():
+        yield chunk
+
+
+def _extraction_prompt(text, parser):
+    return f"""
         You are a medical data extraction expert. Extract all medical test parameters from this report.
+        The text may be one section of a longer report; extract only what appears in it.
         
         Medical Report Text:
-        {full_text}
+        {text}
         
         Extract each test with its observed value and reference range. Format your response exactly as in this example:
         {{
@@ -132,26 +347,69 @@ def ai_based_parse(pdf_file):
         Extract only actual test parameters. Include units in the reference field.
         {parser.get_format_instructions()}
         """
-        
-        # Get response from the LLM
-        messages = [HumanMessage(content=prompt)]
-        response = llm.predict_messages(messages)
-        
-        # Parse the response
-        report = parser.parse(response.content)
-        
-        # Convert to the expected format
-        results = []
-        for param in report.parameters:
-            results.append({
-                "test": param.test,
-                "value": param.value,
-                "reference": param.reference
-            })
-        
-        logger.info(f"AI parsing successful. Extracted {len(results)} parameters.")
-        return results
-        
-    except Exception as e:
-        logger.error(f"AI-based parsing failed: {str(e)}")
-        return []
\ No newline at end of file
+
+
+async def _extract_chunk(text, parser):
+    response = await achat(
+        [{"role": "user", "content": _extraction_prompt(text, parser)}],
+        site="ai_based_parse",
+        temperature=0,
+        response_format={"type": "json_object"}
+    )
+    report = parser.parse(response.choices[0].message.content)
+    return [{"test": param.test, "value": param.value, "reference": param.reference, "source": "ai"}
+            for param in report.parameters]
+
+
+def ai_based_parse(pdf_file):
+    """AI-based parsing: extract page/section chunks concurrently with the MedicalReport schema"""
+    # langchain is slow to import and only this fallback needs it
+    from langchain.output_parsers import PydanticOutputParser
+
+    document = pdf_file if isinstance(pdf_file, (PdfDocument, ExtractedText)) else PdfDocument(pdf_file)
+    parser = PydanticOutputParser(pydantic_object=MedicalReport)
+
+    # Chunks are submitted as soon as their pages are extracted
+    chunks, futures = [], []
+    for text in _chunk_texts(document, AI_PARSE_CHUNK_TOKENS * 4):
+        chunks.append(text)
+        futures.append(submit(lambda text=text: _extract_chunk(text, parser)))
+
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+    for attempt in range(AI_PARSE_MAX_RETRIES + 1):
+        if attempt:
+            # Only the chunks that failed are asked again
+            futures = {index: submit(lambda text=chunks[index]: _extract_chunk(text, parser)) for index in pending}
+        else:
+            futures = dict(enumerate(futures))
+        failed, circuit_open = [], False
+        for index, future in futures.items():
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.warning(f"AI-based parsing of chunk {index + 1}/{len(chunks)} failed: {e}")
+                failed.append(index)
+                circuit_open = circuit_open or isinstance(e, CircuitOpenError)
+        pending = failed
+        # No point asking again while the endpoint is failing fast
+        if not pending or circuit_open:
+            break
+
+    # Merge in document order; a row split across chunk boundaries may be returned twice
+    merged, seen = [], set()
+    for index, rows in enumerate(results):
+        if rows is None:
+            metrics.record_fallback("ai_based_parse")
+            continue
+        for row in rows:
+            key = (normalize_text(row["test"]), row["value"].strip())
+            if key not in seen:
+                seen.add(key)
+                merged.append(row)
+
+    missing = results.count(None)
+    if missing:
+        logger.error(f"AI-based parsing failed for {missing} of {len(chunks)} chunks")
+    logger.info(f"AI parsing extracted {len(merged)} parameters from {len(chunks)} chunks.")
+    return merged
@@ -0,0 +1,204 @@
+# pipeline.py - small DAG executor for the report analysis stages
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Shared by every session so a busy container doesn't spawn a pool per report
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_MAX_WORKERS", "8")),
+    thread_name_prefix="pipeline"
+)
+
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when its run has been cancelled"""
+
+
+class StageContext:
+    """Handle passed to every stage function for progress events and cancellation checks"""
+
+    def __init__(self, run, stage):
+        self._run = run
+        self.stage = stage
+
+    @property
+    def cancelled(self):
+        return self._run.cancelled
+
+    def check(self):
+        if self._run.cancelled:
+            raise PipelineCancelled(self.stage)
+
+    def emit(self, payload):
+        """Send a progress payload to whoever is consuming run.events() and to stages streaming this one"""
+        if not self._run.cancelled:
+            self._run._events.put((self.stage, "progress", payload))
+            self._run._publish(self.stage, payload)
+
+    def stream(self, stage):
+        """Iterate the payloads `stage` emits, as it emits them; ends when that stage finishes"""
+        return self._run._iter_stream(stage, self.stage)
+
+
+class Pipeline:
+    """Stages with dependencies; each stage starts as soon as all of its dependencies finish"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add_stage(self, name, fn, deps=(), streams=()):
+        """Register fn under `name`.
+
+        Root stages are called as fn(ctx, **inputs) with the keyword arguments given to
+        start(); dependent stages are called as fn(ctx, **{dep: dep_result}). Stages listed
+        in `streams` don't hold this one back: it starts alongside them and reads what they
+        emit through ctx.stream(stage).
+        """
+        missing = [dep for dep in (*deps, *streams) if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+        self.stages[name] = (fn, tuple(deps), tuple(streams))
+        return fn
+
+    def start(self, **inputs):
+        return PipelineRun(self, inputs)
+
+
+class PipelineRun:
+    """One execution of a Pipeline; consume events() to follow progress"""
+
+    def __init__(self, pipeline, inputs):
+        self.pipeline = pipeline
+        self.inputs = inputs
+        self.results = {}
+        self.timings = {}
+        self.error = None
+        self._events = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stream_ready = threading.Condition(self._lock)
+        self._streamed = {stage: [] for _, _, streams in pipeline.stages.values() for stage in streams}
+        self._futures = {}
+        self._finished = set()
+        self._started = time.perf_counter()
+
+        with self._lock:
+            for name, (_, deps, _) in pipeline.stages.items():
+                if not deps:
+                    self._submit(name)
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def completed(self):
+        return len(self._finished) == len(self.pipeline.stages)
+
+    def _submit(self, name):
+        fn, deps, streams = self.pipeline.stages[name]
+        kwargs = {dep: self.results[dep] for dep in deps} if deps or streams else dict(self.inputs)
+        # Copy the caller's context so context-local state (e.g. per-report metrics) follows the stage
+        context = contextvars.copy_context()
+        self._futures[name] = _executor.submit(context.run, self._run_stage, name, fn, kwargs)
+
+    def _run_stage(self, name, fn, kwargs):
+        if self.cancelled:
+            return
+        started = time.perf_counter()
+        try:
+            result = fn(StageContext(self, name), **kwargs)
+        except PipelineCancelled:
+            logger.info(f"Stage '{name}' cancelled")
+            return
+        except Exception as e:
+            logger.error(f"Stage '{name}' failed: {str(e)}")
+            self.error = e
+            self._events.put((name, "error", e))
+            with self._lock:
+                self._stream_ready.notify_all()
+            return
+        finally:
+            self.timings[name] = time.perf_counter() - started
+            metrics.record_stage(name, self.timings[name])
+
+        if self.cancelled:
+            return
+        logger.info(f"Stage '{name}' finished in {self.timings[name]:.2f}s")
+        with self._lock:
+            self.results[name] = result
+            self._finished.add(name)
+            # Report completion before dependents start so consumers see events in DAG order
+            self._events.put((name, "done", result))
+            self._stream_ready.notify_all()
+            ready = [
+                stage for stage, (_, deps, _) in self.pipeline.stages.items()
+                if stage not in self._futures and all(dep in self._finished for dep in deps)
+            ]
+            for stage in ready:
+                self._submit(stage)
+
+    def _publish(self, stage, payload):
+        if stage in self._streamed:
+            with self._lock:
+                self._streamed[stage].append(payload)
+                self._stream_ready.notify_all()
+
+    def _iter_stream(self, stage, reader):
+        position = 0
+        while True:
+            with self._lock:
+                while position == len(self._streamed[stage]) and stage not in self._finished:
+                    if self.cancelled or self.error is not None:
+                        raise PipelineCancelled(reader)
+                    self._stream_ready.wait()
+                payloads = self._streamed[stage][position:]
+                finished = stage in self._finished
+            for payload in payloads:
+                yield payload
+            position += len(payloads)
+            if finished and position == len(self._streamed[stage]):
+                return
+
+    def events(self):
+        """Yield (stage, kind, payload) tuples until every stage has finished.
+
+        kind is "progress" for payloads sent with ctx.emit() and "done" when a stage
+        completes. A failing stage cancels the rest of the run and its exception is raised.
+        """
+        remaining = len(self.pipeline.stages)
+        while remaining and not self.cancelled:
+            stage, kind, payload = self._events.get()
+            if kind == "cancelled":
+                break
+            if kind == "error":
+                self.cancel()
+                raise payload
+            if kind == "done":
+                remaining -= 1
+            yield stage, kind, payload
+        logger.info(f"Pipeline finished in {time.perf_counter() - self._started:.2f}s: {self.timings}")
+
+    def cancel(self):
+        """Drop in-flight work: queued stages never start and running stages see ctx.cancelled"""
+        if self.completed or self.cancelled:
+            return
+        self._cancel_event.set()
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._stream_ready.notify_all()
+        # Wakes a consumer blocked in events(), which would otherwise wait for stages that never report
+        self._events.put((None, "cancelled", None))
+        logger.info("Pipeline run cancelled")
+
+    def result(self, stage):
+        return self.results.get(stage)
@@ -0,0 +1,115 @@
+# refrange.py - deterministic status classification from reference ranges
+import os
+import re
+from typing import NamedTuple, Optional
+
+# Fraction of the range (or of the bound, for one-sided ranges) treated as borderline.
+# Values just inside a limit are "Moderate"; values outside but within the outer margin are too.
+BORDERLINE_INNER_MARGIN = float(os.getenv("BORDERLINE_INNER_MARGIN", "0.05"))
+BORDERLINE_OUTER_MARGIN = float(os.getenv("BORDERLINE_OUTER_MARGIN", "0.10"))
+
+NUMBER = r'(\d+(?:,\d+)*(?:\.\d+)?|\.\d+)'
+
+range_pattern = re.compile(NUMBER + r'\s*(?:-|–|—|to)\s*' + NUMBER, re.IGNORECASE)
+upper_pattern = re.compile(r'(<=|=<|≤|<|less\s+than|below|up\s*to)\s*' + NUMBER, re.IGNORECASE)
+lower_pattern = re.compile(r'(>=|=>|≥|>|more\s+than|greater\s+than|above)\s*' + NUMBER, re.IGNORECASE)
+# Spelled-out sexes may be followed directly by the range ("Male 13.0-17.0"); single letters need a ":" or "="
+sex_pattern = re.compile(r'\b(?:(male|female|men|women)\b\s*[:=]?|(m|f)\s*[:=])', re.IGNORECASE)
+# Unit tokens whose digits would otherwise be read as part of the range: "10^3/uL", "x10³", "thou/mm3"
+unit_pattern = re.compile(r'[^\s\d.<>=≤≥-]*/\S*|(?:x\s*)?10\s*(?:\^|\*\*)\s*-?\d+|10[⁰¹²³⁴⁵⁶⁷⁸⁹]+|\b[a-zµμ]+[\d²³]+\b', re.IGNORECASE)
+# "Label:" before a range; anything but these plain labels names a tier ("Desirable:", "High:", "Diabetes:")
+label_pattern = re.compile(r'([a-z][a-z ]*?)\s*[:=]', re.IGNORECASE)
+PLAIN_LABELS = {"normal", "ref", "reference", "range", "normal range", "reference range", "reference interval",
+                "biological reference interval"}
+
+
+class ReferenceRange(NamedTuple):
+    low: Optional[float]
+    high: Optional[float]
+
+
+def _to_float(text):
+    return float(text.replace(',', ''))
+
+
+def _parse_single(text):
+    """Parse one range expression such as "13.0 - 17.0 g/dL", "<200 mg/dL" or "≥ 40".
+
+    Multi-tier references ("Desirable: <200 Borderline: 200-239 High: >=240") return None, so the model decides."""
+    text = unit_pattern.sub(" ", text)
+    if any(label.strip().lower() not in PLAIN_LABELS for label in label_pattern.findall(text)):
+        return None
+    remainder = range_pattern.sub(" ", text)
+    expressions = len(range_pattern.findall(text)) + len(upper_pattern.findall(remainder)) + len(lower_pattern.findall(remainder))
+    if expressions != 1:
+        return None
+    if match := range_pattern.search(text):
+        low, high = _to_float(match.group(1)), _to_float(match.group(2))
+        return ReferenceRange(min(low, high), max(low, high))
+    if match := upper_pattern.search(text):
+        return ReferenceRange(None, _to_float(match.group(2)))
+    if match := lower_pattern.search(text):
+        return ReferenceRange(_to_float(match.group(2)), None)
+    return None
+
+
+def parse_reference(reference):
+    """Parse a reference string into {sex: ReferenceRange}, using the key None for non sex-specific ranges"""
+    if not reference:
+        return {}
+
+    markers = list(sex_pattern.finditer(reference))
+    if not markers:
+        parsed = _parse_single(reference)
+        return {None: parsed} if parsed else {}
+
+    ranges = {}
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(reference)
+        sex = "female" if (marker.group(1) or marker.group(2)).lower() in ("female", "women", "f") else "male"
+        parsed = _parse_single(reference[marker.end():end])
+        if parsed is None:
+            # One sex's range unreadable: don't classify against the other's alone
+            return {}
+        ranges[sex] = parsed
+    return ranges
+
+
+def _classify_against(value, ref, inner_margin, outer_margin):
+    if ref.low is not None and ref.high is not None:
+        span = ref.high - ref.low
+        inner, outer = span * inner_margin, span * outer_margin
+    else:
+        bound = ref.high if ref.high is not None else ref.low
+        inner, outer = abs(bound) * inner_margin, abs(bound) * outer_margin
+
+    if ref.high is not None and value > ref.high:
+        return "Moderate" if value <= ref.high + outer else "Immediate Attention"
+    if ref.low is not None and value < ref.low:
+        return "Moderate" if value >= ref.low - outer else "Immediate Attention"
+    if (ref.high is not None and value > ref.high - inner) or (ref.low is not None and value < ref.low + inner):
+        return "Moderate"
+    return "Good"
+
+
+def classify(value, reference, sex=None, inner_margin=None, outer_margin=None):
+    """Return "Good"/"Moderate"/"Immediate Attention", or None when the value or range can't be parsed"""
+    inner_margin = BORDERLINE_INNER_MARGIN if inner_margin is None else inner_margin
+    outer_margin = BORDERLINE_OUTER_MARGIN if outer_margin is None else outer_margin
+
+    try:
+        numeric = _to_float(str(value).strip())
+    except ValueError:
+        return None
+
+    ranges = parse_reference(reference)
+    if not ranges:
+        return None
+    if None in ranges:
+        return _classify_against(numeric, ranges[None], inner_margin, outer_margin)
+    if sex in ranges:
+        return _classify_against(numeric, ranges[sex], inner_margin, outer_margin)
+
+    # Sex unknown: only decide locally when every sex-specific range agrees
+    statuses = {_classify_against(numeric, ref, inner_margin, outer_margin) for ref in ranges.values()}
+    return statuses.pop() if len(statuses) == 1 else None
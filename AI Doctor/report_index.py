@@ -0,0 +1,145 @@
+# report_index.py - per-report parameter index so voice answers send only the rows a question is about
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from cache import normalize_text
+
+EMBEDDING_DIM = 512
+TOP_K = 6
+MIN_SIMILARITY = 0.35       # below this a row is only included through a synonym match
+DIGEST_NAMES = 8            # flagged parameters named in the digest, per status
+INDEXES_KEPT = 64
+
+# \w alone splits Tamil words at their vowel signs
+word_pattern = re.compile(r'[\w\u0B80-\u0BFF]+')
+
+# Question words that say nothing about which test is meant
+STOPWORDS = {
+    "is", "are", "am", "my", "me", "i", "the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "it", "this",
+    "that", "how", "what", "why", "when", "which", "should", "can", "do", "does", "about", "level", "levels", "value",
+    "values", "okay", "ok", "fine", "good", "bad", "normal", "high", "low", "report", "result", "results", "test",
+    "tests", "count", "please", "tell", "explain", "mean", "means", "with", "there", "any", "problem",
+}
+
+# Words patients use (English and Tamil) for each group of tests; a question word in a group selects its tests
+SYNONYM_GROUPS = [
+    {"sugar", "glucose", "diabetes", "hba1c", "fbs", "ppbs", "rbs", "சர்க்கரை", "நீரிழிவு"},
+    {"cholesterol", "lipid", "ldl", "hdl", "vldl", "triglycerides", "fat", "கொலஸ்ட்ரால்", "கொழுப்பு"},
+    {"hemoglobin", "haemoglobin", "hb", "hgb", "anemia", "anaemia", "ஹீமோகுளோபின்", "இரத்த சோகை"},
+    {"thyroid", "tsh", "t3", "t4", "தைராய்டு"},
+    {"liver", "sgot", "sgpt", "ast", "alt", "bilirubin", "alkaline phosphatase", "albumin", "கல்லீரல்"},
+    {"kidney", "renal", "creatinine", "urea", "uric acid", "bun", "egfr", "சிறுநீரகம்"},
+    {"vitamin", "vit", "b12", "விட்டமின்", "வைட்டமின்"},
+    {"iron", "ferritin", "tibc", "இரும்பு"},
+    {"white", "wbc", "leukocyte", "tlc", "neutrophils", "lymphocytes", "infection", "தொற்று"},
+    {"platelet", "platelets", "plt", "தட்டணு"},
+    {"red", "rbc", "hematocrit", "pcv", "mcv", "mch", "mchc"},
+    {"sodium", "potassium", "chloride", "electrolytes", "salt", "உப்பு"},
+    {"calcium", "bone", "எலும்பு"},
+    {"esr", "crp", "inflammation", "வீக்கம்"},
+]
+
+
+def _terms(text):
+    """Single words plus adjacent word pairs, so two-word synonyms like "uric acid" match"""
+    words = word_pattern.findall(normalize_text(text))
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _matches(term, synonym):
+    # Tamil adds case suffixes to the word itself ("சர்க்கரையின்"), so Tamil synonyms match as prefixes
+    return term == synonym or (not synonym.isascii() and term.startswith(synonym))
+
+
+def _groups(text):
+    terms = _terms(text)
+    return {i for i, group in enumerate(SYNONYM_GROUPS)
+            if any(_matches(term, synonym) for term in terms for synonym in group)}
+
+
+def embed(text):
+    """Hashed character-trigram vector (L2-normalized); tolerant of spelling and abbreviation variants"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in word_pattern.findall(normalize_text(text)):
+        if word in STOPWORDS or word.isdigit():
+            continue
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[i:i + 3].encode("utf-8"), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _value(row):
+    return row["Value"].split(" (Ref:")[0]
+
+
+class ReportIndex:
+    """Parameter rows of one analysed report with their synonym groups and embeddings, computed once"""
+
+    def __init__(self, categorized):
+        self.rows = [row for rows in categorized.values() for row in rows]
+        self.groups = [_groups(row["Parameter"]) for row in self.rows]
+        self.embeddings = (np.stack([embed(row["Parameter"]) for row in self.rows])
+                           if self.rows else np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+        self.digest = self._digest(categorized)
+
+    @staticmethod
+    def _digest(categorized):
+        counts = ", ".join(f"{len(rows)} {status}" for status, rows in categorized.items())
+        lines = [f"{sum(len(rows) for rows in categorized.values())} parameters tested: {counts}."]
+        for status in ("Immediate Attention", "Moderate"):
+            if rows := categorized.get(status):
+                names = ", ".join(f"{row['Parameter']} {_value(row)}" for row in rows[:DIGEST_NAMES])
+                more = f" and {len(rows) - DIGEST_NAMES} more" if len(rows) > DIGEST_NAMES else ""
+                lines.append(f"{status}: {names}{more}.")
+        return "\n".join(lines)
+
+    def search(self, question, k=TOP_K):
+        """The k rows most relevant to the question; flagged rows when it names no particular test"""
+        if not self.rows:
+            return []
+        question_groups = _groups(question)
+        scores = self.embeddings @ embed(question)
+        ranked = []
+        for index, score in enumerate(scores):
+            if self.groups[index] & question_groups:
+                score += 1.0
+            if score >= MIN_SIMILARITY:
+                ranked.append((float(score), index))
+        if not ranked:
+            # "How is my report?": the parameters that need attention are what matters
+            flagged = [row for row in self.rows if row["Status"] != "Good"]
+            flagged.sort(key=lambda row: row["Status"] != "Immediate Attention")
+            return flagged[:k]
+        return [self.rows[index] for _, index in sorted(ranked, reverse=True)[:k]]
+
+    def context(self, question, k=TOP_K):
+        """Compact report context for a prompt: the status digest plus the relevant rows"""
+        lines = [self.digest, "", "Relevant results:"]
+        for row in self.search(question, k):
+            lines.append(f"- {row['Parameter']}: {row['Value']}; {row['Status']}. {row['Clinical Significance']}")
+        return "\n".join(lines)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_report_index(digest, categorized):
+    """The index for a report, built on first use and shared by every session that opens the same PDF"""
+    with _indexes_lock:
+        if (index := _indexes.get(digest)) is not None:
+            _indexes.move_to_end(digest)
+            return index
+    index = ReportIndex(categorized)
+    with _indexes_lock:
+        _indexes[digest] = index
+        while len(_indexes) > INDEXES_KEPT:
+            _indexes.popitem(last=False)
+    return index
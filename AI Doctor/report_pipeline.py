@@ -0,0 +1,159 @@
+# report_pipeline.py - parse (streaming into analyses) -> summary || analyses -> categorize
+import io
+import logging
+
+import metrics
+from pipeline import Pipeline
+from pdfhandle import iter_medical_pdf
+from analyze import FALLBACK_ANALYSIS, SUMMARY_FALLBACK, iter_parameter_analyses, stream_report_summary
+from report_store import get_report_store
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("Good", "Moderate", "Immediate Attention")
+
+
+def build_analysis_row(item, analysis):
+    return {
+        "Parameter": item["test"],
+        "Value": f"{item['value']} (Ref: {item['reference']})",
+        "Clinical Significance": analysis["reason"],
+        "Dietary Recommendation": analysis["food"],
+        "Activity Guidance": analysis["exercise"],
+        "Status": analysis["status"]
+    }
+
+
+def has_fallbacks(categorized, summary, report_metrics=None):
+    """True if the summary or any analysis is a canned fallback (or the report's metrics recorded one)"""
+    if summary == SUMMARY_FALLBACK:
+        return True
+    if report_metrics and report_metrics["totals"]["fallbacks"]:
+        return True
+    fallback = build_analysis_row({"test": "", "value": "", "reference": ""}, FALLBACK_ANALYSIS)
+    fields = ("Clinical Significance", "Dietary Recommendation", "Activity Guidance")
+    return any(all(row[field] == fallback[field] for field in fields)
+               for rows in categorized.values() for row in rows)
+
+
+def parse_stage(ctx, pdf_file):
+    """Parse the PDF, emitting each row as it is found so analysis can start before the last page"""
+    rows = []
+    parser = iter_medical_pdf(pdf_file)
+    try:
+        for row in parser:
+            ctx.check()
+            rows.append(row)
+            ctx.emit(row)
+    finally:
+        parser.close()
+    return rows
+
+
+def summary_stage(ctx, parse):
+    """Stream the summary, emitting each delta as a progress event"""
+    if not parse:
+        return ""
+    summary = ""
+    stream = stream_report_summary(parse)
+    try:
+        for delta in stream:
+            ctx.check()
+            summary += delta
+            ctx.emit(delta)
+    finally:
+        stream.close()
+    return summary
+
+
+def analyses_stage(ctx):
+    """Analyze parameters while they are still being parsed, emitting (index, row) as each result arrives"""
+    parsed, rows = [], {}
+
+    def parsed_rows():
+        for item in ctx.stream("parse"):
+            parsed.append(item)
+            yield item
+
+    results = iter_parameter_analyses(parsed_rows())
+    try:
+        for index, analysis in results:
+            ctx.check()
+            rows[index] = build_analysis_row(parsed[index], analysis)
+            ctx.emit((index, rows[index]))
+    finally:
+        # Closing the generator cancels any batch requests still in flight
+        results.close()
+    return [rows[index] for index in range(len(parsed))]
+
+
+def categorize_stage(ctx, analyses):
+    categorized = {status: [] for status in STATUSES}
+    for row in analyses:
+        categorized[row["Status"]].append(row)
+    return categorized
+
+
+report_pipeline = Pipeline()
+report_pipeline.add_stage("parse", parse_stage)
+report_pipeline.add_stage("summary", summary_stage, deps=("parse",))
+report_pipeline.add_stage("analyses", analyses_stage, streams=("parse",))
+report_pipeline.add_stage("categorize", categorize_stage, deps=("analyses",))
+
+
+def start_report_analysis(pdf_file, report_id=None):
+    """Start the report pipeline; consume run.events() to render progress.
+
+    Everything the run records is attributed to one report; fetch it afterwards with
+    metrics.report_breakdown(run.report_id).
+    """
+    with metrics.report_scope(report_id) as report:
+        run = report_pipeline.start(pdf_file=pdf_file)
+    run.report_id = report.report_id
+    return run
+
+
+def report_job(job, pdf_bytes, digest):
+    """Job body for jobs.JobManager: run the pipeline, publishing per-stage progress and partial results.
+
+    The result is also written to the report store, so it outlives the session that submitted it; results
+    with fallback answers are not, so the next upload asks the model again."""
+    run = start_report_analysis(io.BytesIO(pdf_bytes))
+    # A job nobody waits for any more (its session uploaded another file) drops its in-flight stages
+    job.on_cancel(run.cancel)
+    summary, rows, parsed = "", {}, 0
+    try:
+        for stage, kind, payload in run.events():
+            if kind == "done":
+                job.stage(stage, status="done")
+                if stage == "parse" and not payload:
+                    run.cancel()
+                    raise ValueError("No parameters found in document. Please ensure this is a standard medical report.")
+            elif stage == "parse":
+                parsed += 1
+                job.stage("parse", done=parsed)
+                job.stage("analyses", total=parsed)
+            elif stage == "summary":
+                summary += payload
+                job.stage("summary", done=len(summary))
+                job.publish(summary=summary)
+            elif stage == "analyses":
+                index, row = payload
+                rows[index] = row
+                job.stage("analyses", done=len(rows))
+                job.publish(rows=[rows[i] for i in sorted(rows)])
+    finally:
+        run.cancel()
+    job.check()
+
+    result = {
+        "raw_data": run.result("parse"),
+        "categorized": run.result("categorize"),
+        "summary": run.result("summary"),
+        "report_metrics": metrics.report_breakdown(run.report_id)
+    }
+    if has_fallbacks(result["categorized"], result["summary"], result["report_metrics"]):
+        logger.warning(f"Report {digest[:12]} has fallback answers; not storing it")
+    elif report_store := get_report_store():
+        report_store.put_report(digest, result["raw_data"], result["categorized"], result["summary"])
+    return result
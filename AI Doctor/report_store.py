@@ -0,0 +1,194 @@
+# report_store.py - processed reports keyed by the SHA-256 of the uploaded PDF, shared across sessions on one host
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from cache import CACHE_DIR, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# SQLite in WAL mode needs a local filesystem: the store is shared by the processes of one host only, so keep
+# REPORT_STORE_PATH off network mounts (NFS, SMB); each host keeps its own store
+REPORT_STORE_PATH = os.getenv("REPORT_STORE_PATH", os.path.join(CACHE_DIR, "reports.sqlite3"))
+REPORT_STORE_MAX_MB = float(os.getenv("REPORT_STORE_MAX_MB", "500"))
+# Stored reports and answers are deleted this long after they were written
+REPORT_STORE_MAX_AGE_DAYS = float(os.getenv("REPORT_STORE_MAX_AGE_DAYS", "30"))
+# Everything stored is encrypted at rest with this Fernet key (cryptography.fernet.Fernet.generate_key());
+# without it a key is generated once into STORE_KEY_PATH, readable only by this user
+REPORT_STORE_KEY = os.getenv("REPORT_STORE_KEY")
+STORE_KEY_PATH = os.getenv("STORE_KEY_PATH", os.path.join(CACHE_DIR, "store.key"))
+
+
+def load_store_key():
+    """The at-rest encryption key for stored reports and audio: REPORT_STORE_KEY, else the generated key file"""
+    from cryptography.fernet import Fernet
+
+    if REPORT_STORE_KEY:
+        return REPORT_STORE_KEY.encode()
+    try:
+        with open(STORE_KEY_PATH, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    if os.path.dirname(STORE_KEY_PATH):
+        os.makedirs(os.path.dirname(STORE_KEY_PATH), exist_ok=True)
+    key = Fernet.generate_key()
+    try:
+        # O_EXCL: if another process created the key first, use theirs
+        fd = os.open(STORE_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(STORE_KEY_PATH, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    logger.info(f"Generated storage encryption key at {STORE_KEY_PATH}")
+    return key
+
+
+def report_digest(data):
+    """Stable content digest of the PDF bytes (unlike hash(), the same in every process)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ReportStore:
+    """Blobs per (digest, kind) in SQLite, expiring after max_age, with least-recently-used eviction by total size"""
+
+    def __init__(self, path, max_bytes, key=None, max_age=REPORT_STORE_MAX_AGE_DAYS * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._fernet = None
+        self._lock = threading.Lock()
+        if key:
+            from cryptography.fernet import Fernet
+            self._fernet = Fernet(key.encode() if isinstance(key, str) else key)
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            "digest TEXT NOT NULL, kind TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (digest, kind))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_accessed ON reports(accessed)")
+
+    def get(self, digest, kind):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM reports WHERE digest = ? AND kind = ? AND created >= ?",
+                (digest, kind, time.time() - self.max_age)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE reports SET accessed = ? WHERE digest = ? AND kind = ?", (time.time(), digest, kind)
+                )
+        metrics.record_cache("report_store", hit=bool(row))
+        if not row:
+            return None
+        value = bytes(row[0])
+        if self._fernet:
+            from cryptography.fernet import InvalidToken
+            try:
+                value = self._fernet.decrypt(value)
+            except InvalidToken:
+                # Written with another key (or unencrypted); treat as a miss
+                logger.warning(f"Could not decrypt stored {kind} for report {digest[:12]}")
+                return None
+        return value
+
+    def put(self, digest, kind, value):
+        if self._fernet:
+            value = self._fernet.encrypt(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (digest, kind, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, kind, value, len(value), now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        expired = self._conn.execute("DELETE FROM reports WHERE created < ?", (time.time() - self.max_age,)).rowcount
+        if expired:
+            logger.info(f"Deleted {expired} expired report entries")
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Free an extra 10% so eviction doesn't run on every insert once the store is full
+        target = total - self.max_bytes + self.max_bytes // 10
+        freed, evicted = 0, []
+        for digest, kind, size in self._conn.execute("SELECT digest, kind, size FROM reports ORDER BY accessed ASC"):
+            if freed >= target:
+                break
+            evicted.append((digest, kind))
+            freed += size
+        self._conn.executemany("DELETE FROM reports WHERE digest = ? AND kind = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} stored report entries ({freed / 1e6:.1f} MB)")
+
+    def get_json(self, digest, kind):
+        value = self.get(digest, kind)
+        return json.loads(value) if value is not None else None
+
+    def put_json(self, digest, kind, value):
+        self.put(digest, kind, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def get_report(self, digest):
+        """{raw_data, categorized, summary} for a report processed before, on any worker"""
+        return self.get_json(digest, "report")
+
+    def put_report(self, digest, raw_data, categorized, summary):
+        self.put_json(digest, "report", {"raw_data": raw_data, "categorized": categorized, "summary": summary})
+
+    def get_answer(self, digest, question):
+        """A stored voice answer to this question about this report, with its audio bytes"""
+        kind = "answer:" + hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest()
+        response = self.get_json(digest, kind)
+        if response is not None and response.pop("has_audio", False):
+            response["audio"] = self.get(digest, kind + ":audio")
+        return response
+
+    def put_answer(self, digest, question, response, audio=None):
+        kind = "answer:" + hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest()
+        if audio:
+            self.put(digest, kind + ":audio", audio)
+        self.put_json(digest, kind, {**response, "has_audio": bool(audio)})
+
+    def delete_report(self, digest):
+        """Remove everything stored for one report: the analysis and every stored voice answer"""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM reports WHERE digest = ?", (digest,)).rowcount
+        logger.info(f"Deleted {deleted} stored entries for report {digest[:12]}")
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "encrypted": bool(self._fernet)}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_report_store():
+    """The process-wide store, or None if it can't be opened (the app then just recomputes)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = ReportStore(REPORT_STORE_PATH, int(REPORT_STORE_MAX_MB * 1024 * 1024), load_store_key())
+            except ImportError:
+                # Never fall back to plaintext
+                logger.error("The cryptography package is not installed; report store disabled")
+                _store = False
+            except Exception as e:
+                logger.error(f"Could not open report store at {REPORT_STORE_PATH}: {str(e)}")
+                _store = False
+        return _store or None
@@ -0,0 +1,151 @@
+# stt.py - speech-to-text for browser recordings: energy VAD, per-session calibration, pluggable engines
+import io
+import logging
+import os
+import wave
+from abc import ABC, abstractmethod
+
+import numpy as np
+import streamlit as st
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# "google" (online, speech_recognition) or "whisper" (offline on CPU, needs faster-whisper and a model)
+STT_ENGINE = os.getenv("STT_ENGINE", "google")
+STT_LANGUAGE = os.getenv("STT_LANGUAGE", "ta-IN")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+
+FRAME_MS = 30
+SPEECH_RATIO = 3.0          # a frame is speech when its energy is this many times the noise floor
+MIN_SPEECH_ENERGY = 150     # int16 RMS; keeps a near-silent room from treating hiss as speech
+PADDING_MS = 150            # kept either side of the detected speech so word edges aren't clipped
+CALIBRATION_WEIGHT = 0.3    # how much a new recording moves the session's cached noise floor
+
+
+def read_wav(data):
+    """(mono int16 samples, sample rate) from WAV bytes such as st.audio_input returns"""
+    with wave.open(io.BytesIO(data)) as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Unsupported sample width: {wav.getsampwidth() * 8} bits")
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        channels, sample_rate = wav.getnchannels(), wav.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+def frame_energies(samples, sample_rate):
+    """RMS energy of consecutive FRAME_MS frames"""
+    size = max(1, sample_rate * FRAME_MS // 1000)
+    frames = samples[:len(samples) // size * size].astype(np.float32).reshape(-1, size)
+    return np.sqrt((frames ** 2).mean(axis=1)) if len(frames) else np.zeros(0, dtype=np.float32)
+
+
+def calibrate(energies, calibration):
+    """Noise floor for this recording, blended into the session's cached value so quiet clips stay reliable"""
+    measured = float(np.percentile(energies, 10)) if len(energies) else 0.0
+    cached = calibration.get("noise_floor") if calibration is not None else None
+    floor = measured if cached is None else (1 - CALIBRATION_WEIGHT) * cached + CALIBRATION_WEIGHT * measured
+    if calibration is not None:
+        calibration["noise_floor"] = floor
+    return floor
+
+
+def detect_speech(energies, noise_floor):
+    """(first, last) speech frame of the whole recording, None if silent.
+
+    The recording is already finished, so only leading and trailing silence is trimmed; pauses in the
+    middle of a question are kept."""
+    speech = np.flatnonzero(energies > max(noise_floor * SPEECH_RATIO, MIN_SPEECH_ENERGY))
+    if not len(speech):
+        return None
+    return int(speech[0]), int(speech[-1])
+
+
+class SpeechEngine(ABC):
+    """Turns 16-bit mono PCM into text; on_partial(text) may be called with interim hypotheses"""
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, samples, sample_rate, on_partial=None):
+        """Recognized text, or None when nothing could be understood"""
+
+
+class GoogleSpeechEngine(SpeechEngine):
+    """Google Web Speech through speech_recognition (what listen_tamil used); final result only"""
+    name = "google"
+
+    def transcribe(self, samples, sample_rate, on_partial=None):
+        import speech_recognition as sr
+
+        audio = sr.AudioData(samples.tobytes(), sample_rate, 2)
+        try:
+            return sr.Recognizer().recognize_google(audio, language=STT_LANGUAGE)
+        except sr.UnknownValueError:
+            return None
+
+
+class WhisperSpeechEngine(SpeechEngine):
+    """Offline faster-whisper on CPU; each decoded segment is reported as a partial result"""
+    name = "whisper"
+
+    def __init__(self, model_name=WHISPER_MODEL):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(model_name, device="cpu", compute_type="int8")
+
+    def transcribe(self, samples, sample_rate, on_partial=None):
+        if sample_rate != 16000:
+            # Whisper expects 16 kHz; linear resampling is plenty for speech
+            positions = np.arange(0, len(samples), sample_rate / 16000)
+            samples = np.interp(positions, np.arange(len(samples)), samples)
+        segments, _ = self.model.transcribe(np.asarray(samples, dtype=np.float32) / 32768.0,
+                                            language=STT_LANGUAGE.split("-")[0], vad_filter=False)
+        text = ""
+        for segment in segments:
+            text = f"{text} {segment.text.strip()}".strip()
+            if on_partial:
+                on_partial(text)
+        return text or None
+
+
+ENGINES = {"google": GoogleSpeechEngine, "whisper": WhisperSpeechEngine}
+
+
+@st.cache_resource(show_spinner=False)
+def get_engine(name=STT_ENGINE):
+    """The configured engine, loaded once per process (offline models are large); Google if it can't load"""
+    try:
+        return ENGINES[name]()
+    except Exception as e:
+        logger.error(f"Could not load speech engine {name!r}, using Google: {str(e)}")
+        return GoogleSpeechEngine()
+
+
+def transcribe_recording(data, calibration=None, on_partial=None):
+    """Tamil text from a WAV recording, or None when no speech is found or it can't be understood.
+
+    `calibration` is a per-session dict holding the ambient noise floor between recordings."""
+    samples, sample_rate = read_wav(data)
+    energies = frame_energies(samples, sample_rate)
+    span = detect_speech(energies, calibrate(energies, calibration))
+    if span is None:
+        logger.info("No speech detected in recording")
+        return None
+
+    # Only the speech (plus a little padding) goes to the recognizer
+    frame, padding = sample_rate * FRAME_MS // 1000, sample_rate * PADDING_MS // 1000
+    start = max(0, span[0] * frame - padding)
+    stop = min(len(samples), (span[1] + 1) * frame + padding)
+    engine = get_engine()
+    try:
+        with metrics.track_call(f"stt_{engine.name}"):
+            text = engine.transcribe(samples[start:stop], sample_rate, on_partial)
+    except Exception as e:
+        logger.error(f"Speech recognition error: {e}")
+        metrics.record_fallback(f"stt_{engine.name}")
+        return None
+    logger.info(f"Recognized Tamil text: {text} ({(stop - start) / sample_rate:.1f}s of {len(samples) / sample_rate:.1f}s sent)")
+    return text
@@ -0,0 +1,91 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import cache
+from cache import SqliteCache, TieredCache, make_key, normalize_number, normalize_text
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_round_trip_and_stats(tmp_path, clock):
+    store = SqliteCache(str(tmp_path / "c.sqlite3"))
+    assert store.get("k") is None
+    store.set("k", {"status": "Good"})
+    assert store.get("k") == {"status": "Good"}
+    assert store.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    store = SqliteCache(str(tmp_path / "c.sqlite3"), ttl=60)
+    store.set("k", "v")
+    clock.now += 60
+    assert store.get("k") == "v"
+    clock.now += 1
+    assert store.get("k") is None
+    # The expired row is deleted, not just skipped
+    assert store.stats()["entries"] == 0
+
+
+def test_eviction_drops_least_recently_used(tmp_path, clock):
+    store = SqliteCache(str(tmp_path / "c.sqlite3"), max_entries=10)
+    for i in range(10):
+        clock.now += 1
+        store.set(f"k{i}", i)
+    clock.now += 1
+    assert store.get("k0") == 0
+    clock.now += 1
+    store.set("k10", 10)
+    # Over the limit: the oldest accesses go, plus 10% headroom (one entry here)
+    assert store.stats()["entries"] == 9
+    assert store.get("k0") == 0
+    assert store.get("k1") is None
+    assert store.get("k2") is None
+    assert store.get("k10") == 10
+
+
+def test_entries_survive_reopening(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite3")
+    SqliteCache(path).set("k", [1, 2])
+    assert SqliteCache(path).get("k") == [1, 2]
+
+
+def test_tiered_cache_serves_memory_then_disk(tmp_path, clock):
+    disk = SqliteCache(str(tmp_path / "c.sqlite3"), ttl=600)
+    tiered = TieredCache(disk, max_items=1, memory_ttl=60)
+    tiered.set("a", 1)
+    assert tiered.get("a") == 1
+    assert tiered.memory_hits == 1 and disk.hits == 0
+
+    # The memory tier holds one item; "a" falls back to disk and is promoted again
+    tiered.set("b", 2)
+    assert tiered.get("a") == 1
+    assert disk.hits == 1
+
+    clock.now += 61
+    assert tiered.get("a") == 1
+    assert disk.hits == 2
+
+
+def test_keys_ignore_formatting():
+    assert normalize_text("  Hemoglobin\n A1c ") == "hemoglobin a1c"
+    assert normalize_number("5.40") == normalize_number("5.4") == "5.4"
+    assert normalize_number("1,200") == "1200"
+    assert normalize_number("<0.5") == "<0.5"
+    assert make_key("a", "b") != make_key("ab")
@@ -0,0 +1,111 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_gateway, "time", clock)
+    return clock
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    # A success resets the count
+    breaker.record_success()
+    assert breaker.state == "closed"
+    _open(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    assert breaker.state == "half-open"
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_call() is False
+
+
+def test_failed_probe_reopens_for_a_full_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    assert breaker.state == "open"
+    clock.now += 1
+    assert breaker.before_call() is True
+
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+    probe = breaker.before_call()
+    breaker.release_probe(probe)
+    assert breaker.state == "half-open"
+    assert breaker.before_call() is True
+
+
+def test_non_retryable_error_frees_the_probe(clock, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock.now += 30
+
+    def create(**kwargs):
+        raise ValueError("bad request")
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_gateway, "breaker", breaker)
+    monkeypatch.setattr(llm_gateway, "get_client", lambda: client)
+
+    with pytest.raises(ValueError):
+        llm_gateway.chat([{"role": "user", "content": "hi"}], site="test")
+    # A bad request says nothing about the endpoint: the next call may probe instead of failing fast
+    assert breaker.before_call() is True
@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import jobs
+from jobs import JobManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(jobs, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def manager():
+    return JobManager(workers=2, retention=3600, failure_cooldown=300)
+
+
+def _wait(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, f"job {job.id} still {job.status}"
+        time.sleep(0.01)
+    return job
+
+
+def _blocking():
+    """A job body that runs until released, or until its job is cancelled"""
+    release = threading.Event()
+
+    def body(job):
+        job.on_cancel(release.set)
+        release.wait(5)
+        job.check()
+        return "done"
+
+    return body, release
+
+
+def test_same_key_shares_one_job(clock, manager):
+    body, release = _blocking()
+    first = manager.submit("key", body)
+    assert manager.submit("key", body) is first
+    release.set()
+    assert _wait(first).result == "done"
+    # Finished jobs keep serving the result
+    assert manager.submit("key", body) is first
+
+
+def test_failed_job_is_kept_for_the_cooldown(clock, manager):
+    calls = []
+
+    def failing(job):
+        calls.append(1)
+        raise RuntimeError("upstream down")
+
+    failed = _wait(manager.submit("key", failing))
+    assert failed.status == "failed" and failed.error == "upstream down"
+    clock.now += 299
+    assert manager.submit("key", failing) is failed
+    assert len(calls) == 1
+
+    clock.now += 1
+    retried = _wait(manager.submit("key", failing))
+    assert retried is not failed and len(calls) == 2
+
+
+def test_forget_retries_straight_away(clock, manager):
+    failed = _wait(manager.submit("key", lambda job: 1 / 0))
+    manager.forget("key")
+    assert manager.get(failed.id) is None
+    assert _wait(manager.submit("key", lambda job: "ok")).result == "ok"
+
+
+def test_job_is_cancelled_when_its_last_subscriber_leaves(clock, manager):
+    body, _ = _blocking()
+    job = manager.submit("key", body, subscriber="session-1")
+    manager.submit("key", body, subscriber="session-2")
+
+    manager.unsubscribe(job.id, "session-1")
+    assert not job.cancelled
+    manager.unsubscribe(job.id, "session-2")
+    assert _wait(job).status == "cancelled"
+    # A new upload of the same file starts over instead of attaching to the cancelled job
+    assert manager.submit("key", body, subscriber="session-3") is not job
+
+
+def test_jobs_without_subscribers_are_never_cancelled(clock, manager):
+    body, release = _blocking()
+    job = manager.submit("key", body)
+    manager.submit("key", body, subscriber="session-1")
+    manager.unsubscribe(job.id, "session-1")
+    assert not job.cancelled
+    release.set()
+    assert _wait(job).status == "done"
+
+
+def test_queued_job_cancelled_before_it_starts(clock):
+    manager = JobManager(workers=1)
+    body, release = _blocking()
+    running = manager.submit("first", body)
+    calls = []
+    queued = manager.submit("second", lambda job: calls.append(1), subscriber="session-1")
+    manager.unsubscribe(queued.id, "session-1")
+    release.set()
+    assert _wait(running).status == "done"
+    assert _wait(queued).status == "cancelled"
+    assert calls == []
+
+
+def test_finished_jobs_are_pruned_after_retention(clock, manager):
+    job = _wait(manager.submit("key", lambda job: "ok"))
+    clock.now += 3601
+    assert manager.submit("other", lambda job: "ok") is not None
+    assert manager.get(job.id) is None
+
+
+def test_progress_snapshot(clock, manager):
+    def body(job):
+        job.stage("parse", done=3)
+        job.stage("parse", status="done")
+        job.publish(rows=[1, 2, 3])
+        return None
+
+    snapshot = _wait(manager.submit("key", body)).snapshot()
+    assert snapshot["status"] == "done"
+    assert snapshot["stages"]["parse"]["done"] == 3
+    assert snapshot["stages"]["parse"]["status"] == "done"
+    assert snapshot["partial"] == {"rows": [1, 2, 3]}
@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout_parse import table_parse
+
+
+def _page(*rows):
+    return {"number": 1, "text": "", "words": [], "tables": [[["Test", "Result", "Unit", "Reference Range"], *rows]]}
+
+
+def test_ruled_table_rows():
+    rows = table_parse([_page(["Hemoglobin", "14.5", "g/dL", "13.0 - 17.0"])])
+    assert rows == [{"test": "Hemoglobin", "value": "14.5", "reference": "13.0 - 17.0 g/dL", "source": "table"}]
+
+
+def test_censored_values_keep_their_qualifier():
+    rows = table_parse([_page(["CRP", "<0.5", "mg/dL", "0 - 1.0"], ["Ferritin", ">1000", "ng/mL", "30 - 400"])])
+    assert [row["value"] for row in rows] == ["<0.5", ">1000"]
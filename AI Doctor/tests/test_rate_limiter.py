@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import llm_async
+from llm_async import RateLimiter, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_async, "time", clock)
+    return clock
+
+
+def test_bucket_starts_full_then_waits_for_a_request_slot(clock):
+    limiter = RateLimiter(rpm=60, tpm=100_000)
+    for _ in range(60):
+        assert limiter._reserve(10) == 0.0
+    # One request per second refills at 60 rpm
+    assert limiter._reserve(10) == pytest.approx(1.0)
+    clock.now += 1
+    assert limiter._reserve(10) == 0.0
+
+
+def test_token_budget_limits_large_requests(clock):
+    limiter = RateLimiter(rpm=1000, tpm=6000)
+    assert limiter._reserve(5000) == 0.0
+    # 1000 tokens left; 3000 more need 30 seconds at 100 tokens per second
+    assert limiter._reserve(4000) == pytest.approx(30.0)
+
+
+def test_request_larger_than_the_quota_does_not_wait_forever(clock):
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    assert limiter._reserve(50_000) == 0.0
+    assert limiter._reserve(50_000) == pytest.approx(60.0)
+
+
+def test_refill_is_capped_at_the_quota(clock):
+    limiter = RateLimiter(rpm=2, tpm=100_000)
+    clock.now += 3600
+    assert limiter._reserve(1) == 0.0
+    assert limiter._reserve(1) == 0.0
+    assert limiter._reserve(1) > 0
+
+
+def test_refund_returns_unused_tokens(clock):
+    limiter = RateLimiter(rpm=1000, tpm=1000)
+    limiter._reserve(1000)
+    limiter.refund(reserved=1000, used=400)
+    assert limiter._reserve(600) == 0.0
+    # Unknown usage, or more than reserved, returns nothing
+    limiter.refund(reserved=100, used=None)
+    limiter.refund(reserved=100, used=200)
+    assert limiter._reserve(1) > 0
+
+
+def test_pause_holds_back_every_caller(clock):
+    limiter = RateLimiter(rpm=1000, tpm=100_000)
+    limiter.pause(5)
+    assert limiter._reserve(1) == pytest.approx(5.0)
+    clock.now += 5
+    assert limiter._reserve(1) == 0.0
+
+
+def test_acquire_sync_sleeps_until_capacity(clock):
+    limiter = RateLimiter(rpm=60, tpm=100_000)
+    for _ in range(61):
+        limiter.acquire_sync(1)
+    assert clock.slept == pytest.approx(1.0)
+
+
+def test_acquire_waits_on_the_event_loop(clock, monkeypatch):
+    limiter = RateLimiter(rpm=1, tpm=100_000)
+    delays = []
+
+    async def fake_sleep(seconds):
+        delays.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(llm_async.asyncio, "sleep", fake_sleep)
+
+    async def two_requests():
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+
+    asyncio.run(two_requests())
+    assert delays == [pytest.approx(60.0)]
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after": "7"}, 7.0),
+    ({"retry-after": "soon"}, 3),
+    ({}, 3),
+])
+def test_retry_after_seconds(headers, expected):
+    error = SimpleNamespace(response=SimpleNamespace(headers=headers))
+    assert retry_after_seconds(error, default=3) == expected
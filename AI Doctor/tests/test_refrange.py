@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from refrange import classify, parse_reference, ReferenceRange
+
+
+@pytest.mark.parametrize("value, reference, expected", [
+    ("14.5", "13.0 - 17.0 g/dL", "Good"),
+    ("180", "<200 mg/dL", "Good"),
+    ("180", "<200mg/dL", "Good"),
+    ("1.0", "0.7-1.3mg/dL", "Good"),
+    ("260", "<200 mg/dL", "Immediate Attention"),
+    ("45", ">= 40 mg/dL", "Good"),
+    ("7", "4-11 10^3/uL", "Good"),
+    ("15", "4-11 10^3/uL", "Immediate Attention"),
+    ("250", "150 - 410 thou/mm3", "Good"),
+])
+def test_single_ranges(value, reference, expected):
+    assert classify(value, reference) == expected
+
+
+@pytest.mark.parametrize("value, reference", [
+    ("180", "Desirable: <200 Borderline: 200-239 High: >=240 mg/dL"),
+    ("5.4", "Normal: <5.7 Prediabetes: 5.7-6.4 Diabetes: >=6.5 %"),
+    ("25", "Deficient: <20 Insufficient: 20-30 Sufficient: 30-100 ng/mL"),
+    ("220", "High: >=240"),
+])
+def test_multi_tier_references_defer_to_the_model(value, reference):
+    assert classify(value, reference) is None
+
+
+@pytest.mark.parametrize("value", ["<0.5", ">100"])
+def test_censored_values_defer_to_the_model(value):
+    assert classify(value, "0.2 - 1.0 mg/dL") is None
+
+
+def test_unit_exponent_is_not_part_of_the_range():
+    assert parse_reference("10^3/uL 4-11") == {None: ReferenceRange(4.0, 11.0)}
+    assert classify("3", "10^3/uL 4-11") == "Immediate Attention"
+    assert classify("6", "x10³/µL 4-11") == "Good"
+
+
+def test_sex_labels_without_colon():
+    reference = "Male 13.0-17.0 Female 12.0-15.0"
+    assert parse_reference(reference) == {"male": ReferenceRange(13.0, 17.0), "female": ReferenceRange(12.0, 15.0)}
+    assert classify("12.5", reference, sex="female") == "Good"
+    # Unknown sex and the ranges disagree: left to the model
+    assert classify("12.5", reference) is None
+    assert classify("14", "M: 13-17 F: 12-15") == "Good"
+
+
+def test_plain_labels_still_parse():
+    assert classify("5.0", "Normal: <5.7 %") == "Good"
+    assert classify("14", "Ref: 13-17") == "Good"
+
+
+def test_unparseable_values():
+    assert classify("Negative", "Negative") is None
+    assert classify("12", "") is None
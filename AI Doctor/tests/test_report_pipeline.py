@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyze import FALLBACK_ANALYSIS, SUMMARY_FALLBACK
+from report_pipeline import build_analysis_row, has_fallbacks
+
+ITEM = {"test": "Hemoglobin", "value": "14.5", "reference": "13.0 - 17.0 g/dL"}
+ANSWER = {"status": "Good", "reason": "Within range", "food": "Leafy greens", "exercise": "Walking"}
+
+
+def _categorized(*analyses):
+    categorized = {"Good": [], "Moderate": [], "Immediate Attention": []}
+    for analysis in analyses:
+        categorized[analysis["status"]].append(build_analysis_row(ITEM, analysis))
+    return categorized
+
+
+def test_complete_report_has_no_fallbacks():
+    assert not has_fallbacks(_categorized(ANSWER), "All results are normal.")
+
+
+def test_fallback_analysis_is_found_whatever_its_status():
+    # Local classification may have replaced the fallback's status
+    assert has_fallbacks(_categorized(ANSWER, {**FALLBACK_ANALYSIS, "status": "Good"}), "All results are normal.")
+
+
+def test_fallback_summary():
+    assert has_fallbacks(_categorized(ANSWER), SUMMARY_FALLBACK)
+
+
+def test_fallbacks_recorded_in_report_metrics():
+    assert has_fallbacks(_categorized(ANSWER), "Fine", {"totals": {"fallbacks": 1}})
+    assert not has_fallbacks(_categorized(ANSWER), "Fine", {"totals": {"fallbacks": 0}})
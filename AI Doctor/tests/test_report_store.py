@@ -0,0 +1,117 @@
+import os
+import stat
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from cryptography.fernet import Fernet
+
+import report_store
+from report_store import ReportStore, load_store_key
+
+DIGEST = "a" * 64
+REPORT = {"raw_data": [{"test": "Hemoglobin", "value": "14.5"}], "categorized": {"Good": []}, "summary": "Fine"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(report_store, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def key():
+    return Fernet.generate_key()
+
+
+def _store(tmp_path, key, **kwargs):
+    return ReportStore(str(tmp_path / "reports.sqlite3"), kwargs.pop("max_bytes", 10 ** 6), key, **kwargs)
+
+
+def test_reports_are_encrypted_at_rest(tmp_path, clock, key):
+    store = _store(tmp_path, key)
+    store.put_report(DIGEST, **REPORT)
+    assert store.get_report(DIGEST) == REPORT
+    assert store.stats()["encrypted"]
+
+    store._conn.execute("PRAGMA wal_checkpoint(FULL)")
+    with open(tmp_path / "reports.sqlite3", "rb") as f:
+        assert b"Hemoglobin" not in f.read()
+
+
+def test_another_key_reads_as_a_miss(tmp_path, clock, key):
+    _store(tmp_path, key).put_report(DIGEST, **REPORT)
+    assert _store(tmp_path, Fernet.generate_key()).get_report(DIGEST) is None
+
+
+def test_entries_expire_after_max_age(tmp_path, clock, key):
+    store = _store(tmp_path, key, max_age=3600)
+    store.put_report(DIGEST, **REPORT)
+    clock.now += 3600
+    assert store.get_report(DIGEST) == REPORT
+    clock.now += 1
+    assert store.get_report(DIGEST) is None
+
+    # The next write deletes expired rows rather than only hiding them
+    store.put_report("b" * 64, **REPORT)
+    assert store.stats()["entries"] == 1
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path, clock):
+    # Unencrypted so sizes are exact: four 700-byte blobs pass the limit and one must go
+    store = _store(tmp_path, None, max_bytes=2500)
+    for digest in ("a", "b", "c"):
+        clock.now += 1
+        store.put(digest * 64, "blob", b"x" * 700)
+    clock.now += 1
+    store.get("a" * 64, "blob")
+    clock.now += 1
+    store.put("d" * 64, "blob", b"x" * 700)
+    assert store.stats()["bytes"] == 2100
+    assert store.get("b" * 64, "blob") is None
+    assert store.get("a" * 64, "blob") == b"x" * 700
+    assert store.get("d" * 64, "blob") == b"x" * 700
+
+
+def test_answers_and_audio_are_found_by_normalized_question(tmp_path, clock, key):
+    store = _store(tmp_path, key)
+    store.put_answer(DIGEST, "Is my  Hemoglobin OK?", {"english_response": "Yes"}, audio=b"mp3")
+    assert store.get_answer(DIGEST, "is my hemoglobin ok?") == {"english_response": "Yes", "audio": b"mp3"}
+    assert store.get_answer(DIGEST, "Is my sugar OK?") is None
+
+
+def test_delete_report_removes_the_analysis_and_answers(tmp_path, clock, key):
+    store = _store(tmp_path, key)
+    store.put_report(DIGEST, **REPORT)
+    store.put_answer(DIGEST, "question", {"english_response": "answer"}, audio=b"mp3")
+    store.put_report("b" * 64, **REPORT)
+    assert store.delete_report(DIGEST) == 3
+    assert store.get_report(DIGEST) is None
+    assert store.get_report("b" * 64) == REPORT
+
+
+def test_key_file_is_generated_once_and_private(tmp_path, monkeypatch):
+    path = tmp_path / "keys" / "store.key"
+    monkeypatch.setattr(report_store, "REPORT_STORE_KEY", None)
+    monkeypatch.setattr(report_store, "STORE_KEY_PATH", str(path))
+    key = load_store_key()
+    Fernet(key)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert load_store_key() == key
+
+
+def test_configured_key_wins(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_store, "REPORT_STORE_KEY", "configured")
+    monkeypatch.setattr(report_store, "STORE_KEY_PATH", str(tmp_path / "store.key"))
+    assert load_store_key() == b"configured"
+    assert not (tmp_path / "store.key").exists()
@@ -0,0 +1,105 @@
+# voice_bench.py - latency and token cost of the voice answer modes (VOICE_ANSWER_MODE)
+#
+# Offline by default: Azure calls go to mock_llm_server; Gemini translation calls are simulated with
+# the same latency distribution and a ~4 characters/token estimate, since there is no Gemini mock.
+#   python voice_bench.py --questions 20 --latency lognormal:-0.5,0.4
+# Against the real endpoints (uses your .env): python voice_bench.py --live --questions 5
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+QUESTIONS = [
+    "என் இரத்த அழுத்தம் எப்படி உள்ளது?",
+    "என் சர்க்கரை அளவு 110 சரியா?",
+    "என் கொலஸ்ட்ரால் 240 அதிகமா?",
+    "ஹீமோகுளோபின் 11.5 குறைவா?",
+    "நான் என்ன உணவு சாப்பிட வேண்டும்?",
+    "என் தைராய்டு முடிவுகள் இயல்பானதா?",
+    "விட்டமின் டி 18 என்றால் என்ன செய்ய வேண்டும்?",
+    "என் கல்லீரல் பரிசோதனை நன்றாக உள்ளதா?",
+]
+
+SUMMARY = (
+    "Hemoglobin 11.5 g/dL (low, 13-17). Fasting glucose 110 mg/dL (slightly high, 70-100). Total cholesterol "
+    "240 mg/dL (high, <200). TSH 2.1 uIU/mL (normal). Vitamin D 18 ng/mL (low, 30-100). SGPT 32 U/L (normal)."
+)
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+
+def simulated_gemini(latency):
+    """Stand-in for llm_gateway.gemini_generate: sleeps like a model call and records estimated tokens"""
+    import types
+    import metrics
+
+    def generate(prompt, timeout=None, site="gemini"):
+        with metrics.track_call(site) as call:
+            time.sleep(latency())
+            # Echo the text being translated; the benchmark measures cost and latency, not translation quality
+            text = prompt.split("meaning:", 1)[-1].split("Return only", 1)[0].strip()
+            call.usage = {"prompt_token_count": len(prompt) // 4, "candidates_token_count": len(text) // 4}
+            return types.SimpleNamespace(text=text)
+    return generate
+
+
+def run_mode(mode, questions):
+    import metrics
+    import voice
+
+    voice.VOICE_ANSWER_MODE = mode
+    latencies, calls, tokens = [], [], []
+    for question in questions:
+        with metrics.report_scope() as report:
+            started = time.perf_counter()
+            voice.get_medical_report_answer(SUMMARY, question)
+            latencies.append(time.perf_counter() - started)
+        # Speech synthesis is identical in both modes and not counted
+        sites = {site: values for site, values in report.breakdown()["sites"].items() if site != "text_to_speech"}
+        calls.append(sum(values["calls"] for values in sites.values()))
+        tokens.append(sum(values["prompt_tokens"] + values["completion_tokens"] for values in sites.values()))
+    return {
+        "mode": mode,
+        "questions": len(questions),
+        "latency_p50": round(_percentile(latencies, 50), 3),
+        "latency_p95": round(_percentile(latencies, 95), 3),
+        "latency_mean": round(statistics.mean(latencies), 3),
+        "model_calls_per_question": round(statistics.mean(calls), 2),
+        "tokens_per_question": round(statistics.mean(tokens), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the chained and single-pass voice answer modes")
+    parser.add_argument("--questions", type=int, default=16)
+    parser.add_argument("--latency", default="lognormal:-0.5,0.4", help="Mock latency distribution (see mock_llm_server)")
+    parser.add_argument("--live", action="store_true", help="Use the real Azure and Gemini endpoints from the environment")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    # Fresh translation cache so the chain pays for its translations like a first-time question would
+    os.environ["TRANSLATION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "translation_cache.sqlite3")
+    if not args.live:
+        from mock_llm_server import parse_latency, start_mock_server
+        server, url = start_mock_server(latency=args.latency)
+        os.environ.update({"AZURE_OPENAI_ENDPOINT": url, "AZURE_OPENAI_API_KEY": "mock",
+                           "AZURE_OPENAI_DEPLOYMENT_NAME": "mock"})
+        import voice
+        voice.gemini_generate = simulated_gemini(parse_latency(args.latency))
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] + ("" if i < len(QUESTIONS) else f" ({i})") for i in range(args.questions)]
+    results = [run_mode(mode, questions) for mode in ("chain", "single")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for key in results[0]:
+        print(f"{key:>26}: " + "  ".join(f"{result[key]!s:>10}" for result in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import os
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI, RateLimitError
+import io
 import json
+import asyncio
+from llm_async import rate_limiter, retry_after_seconds, run_sync, gather_limited, LLM_MAX_CONCURRENCY
+from cache import SqliteCache, TieredCache, CACHE_DIR, make_key, normalize_text, normalize_number
 
 # Access secrets from Hugging Face environment
 AZURE_API_KEY = os.getenv("AZURE_API_KEY")
@@ -15,9 +19,52 @@ client = AzureOpenAI(
     api_version=API_VERSION
 )
 
-def analyze_parameter(test_name, value, reference):
-    """Get AI analysis with strict output control"""
-    prompt = f"""Analyze this medical parameter:
+# Async client for the concurrent execution path
+async_client = AsyncAzureOpenAI(
+    api_key=AZURE_API_KEY,
+    azure_endpoint=AZURE_ENDPOINT,
+    api_version=API_VERSION
+)
+
+# Bump whenever the analysis prompt changes so cached answers from the old prompt are ignored
+PROMPT_VERSION = "1"
+
+# Cached analyses and saved reports are kept this long on disk
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 24 * 3600)))
+
+analysis_cache = SqliteCache(
+    os.getenv("ANALYSIS_CACHE_PATH", os.path.join(CACHE_DIR, "analysis_cache.sqlite3")),
+    table="analysis",
+    ttl=ANALYSIS_CACHE_TTL,
+    max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+)
+
+# Parsed rows and finished results per report, keyed by the PDF's digest; a small in-memory tier serves
+# reruns and other sessions, SQLite keeps them across restarts
+report_memo = TieredCache(
+    SqliteCache(
+        os.getenv("REPORT_MEMO_PATH", os.path.join(CACHE_DIR, "report_memo.sqlite3")),
+        table="reports",
+        ttl=ANALYSIS_CACHE_TTL,
+        max_entries=int(os.getenv("REPORT_MEMO_MAX_ENTRIES", "2000"))
+    ),
+    max_items=int(os.getenv("REPORT_MEMO_MEMORY_ITEMS", "64"))
+)
+
+MAX_RATE_LIMIT_RETRIES = 3
+PARAMETER_OUTPUT_TOKENS = 150
+
+VALID_STATUSES = ("Good", "Moderate", "Immediate Attention")
+
+FALLBACK_ANALYSIS = {
+    "status": "Immediate Attention",
+    "reason": "Requires professional evaluation",
+    "food": "Maintain balanced diet",
+    "exercise": "Consult doctor"
+}
+
+def _parameter_prompt(test_name, value, reference):
+    return f"""Analyze this medical parameter:
     Test: {test_name}
     Value: {value}
     Reference: {reference}
@@ -35,6 +82,23 @@ def analyze_parameter(test_name, value, reference):
         "exercise": "45-min daily brisk walking"
     }}"""
 
+def _cache_key(test_name, value, reference):
+    return make_key(PROMPT_VERSION, normalize_text(test_name), normalize_number(value), normalize_text(reference))
+
+def _cache_result(key, analysis):
+    """Only well-formed answers are cached; fallbacks and malformed output are retried next time"""
+    if isinstance(analysis, dict) and analysis.get("status") in VALID_STATUSES:
+        analysis_cache.set(key, analysis)
+    return analysis
+
+def analyze_parameter(test_name, value, reference):
+    """Get AI analysis with strict output control"""
+    key = _cache_key(test_name, value, reference)
+    if cached := analysis_cache.get(key):
+        return cached
+
+    prompt = _parameter_prompt(test_name, value, reference)
+
     try:
         response = client.chat.completions.create(
             model=MODEL_NAME,
@@ -42,12 +106,152 @@ def analyze_parameter(test_name, value, reference):
             temperature=0.1,
             response_format={"type": "json_object"}
         )
-        return json.loads(response.choices[0].message.content)
+        return _cache_result(key, json.loads(response.choices[0].message.content))
     except Exception as e:
         print(f"API Error: {str(e)}")
-        return {
-            "status": "Immediate Attention",
-            "reason": "Requires professional evaluation",
-            "food": "Maintain balanced diet",
-            "exercise": "Consult doctor"
-        }
\ No newline at end of file
+        return dict(FALLBACK_ANALYSIS)
+
+async def _create_completion_async(prompt, max_tokens, **kwargs):
+    """Rate-limited async chat completion that backs off on 429 responses"""
+    # Rough estimate of ~4 characters per token, plus the completion budget
+    reserved = len(prompt) // 4 + 1 + max_tokens
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        await rate_limiter.acquire(reserved)
+        try:
+            response = await async_client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        except RateLimitError as e:
+            if attempt == MAX_RATE_LIMIT_RETRIES:
+                raise
+            rate_limiter.pause(retry_after_seconds(e, default=2 ** attempt))
+            continue
+        usage = getattr(response, "usage", None)
+        rate_limiter.refund(reserved, getattr(usage, "total_tokens", None))
+        return response
+
+async def analyze_parameter_async(test_name, value, reference):
+    """Async variant of analyze_parameter that shares the deployment rate limiter"""
+    key = _cache_key(test_name, value, reference)
+    if cached := analysis_cache.get(key):
+        return cached
+
+    try:
+        response = await _create_completion_async(
+            _parameter_prompt(test_name, value, reference),
+            PARAMETER_OUTPUT_TOKENS,
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        return _cache_result(key, json.loads(response.choices[0].message.content))
+    except Exception as e:
+        print(f"API Error: {str(e)}")
+        return dict(FALLBACK_ANALYSIS)
+
+def analyze_parameters_concurrently(items):
+    """One request per parameter, run concurrently within the rate limit, results in input order"""
+    return run_sync(gather_limited([
+        lambda item=item: analyze_parameter_async(item["test"], item["value"], item["reference"])
+        for item in items
+    ]))
+
+async def _analyze_as_parsed(rows, max_concurrency, on_parsed=None, on_analyzed=None):
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(index, item):
+        async with semaphore:
+            analysis = await analyze_parameter_async(item["test"], item["value"], item["reference"])
+        if on_analyzed:
+            on_analyzed(index, item, analysis)
+        return analysis
+
+    items, tasks = [], []
+    try:
+        async for item in rows:
+            items.append(item)
+            if on_parsed:
+                on_parsed(len(items))
+            tasks.append(asyncio.ensure_future(run(len(items) - 1, item)))
+        return items, await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+def analyze_parameters_as_parsed(rows, max_concurrency=LLM_MAX_CONCURRENCY, on_parsed=None, on_analyzed=None):
+    """Start analyzing each row as the parser yields it (rows is an async iterator, e.g. aiter_medical_pdf).
+
+    Returns (items, analyses) in parse order. on_parsed(count) and on_analyzed(index, item, analysis)
+    report progress from the event loop thread.
+    """
+    return run_sync(_analyze_as_parsed(rows, max_concurrency, on_parsed, on_analyzed))
+
+def build_row(item, analysis):
+    return {
+        "Parameter": item["test"],
+        "Value": f"{item['value']} (Ref: {item['reference']})",
+        "Reason": analysis["reason"],
+        "Food": analysis["food"],
+        "Exercise": analysis["exercise"]
+    }
+
+def _memo_keys(digest):
+    from pdfhandle import PARSER_VERSION
+
+    return (make_key("parse", PARSER_VERSION, digest),
+            make_key("analysis", PARSER_VERSION, PROMPT_VERSION, digest))
+
+def invalidate_report(digest):
+    """Forget the memoized parse and analysis of one report, and its rows' cached analyses, so it is processed again"""
+    parse_key, analysis_key = _memo_keys(digest)
+    for item in report_memo.get(parse_key) or []:
+        analysis_cache.delete(_cache_key(item["test"], item["value"], item["reference"]))
+    report_memo.delete(parse_key)
+    report_memo.delete(analysis_key)
+
+async def _aiter(rows):
+    for row in rows:
+        yield row
+
+def analyze_report_job(job, pdf_bytes, digest):
+    """Job body for jobs.JobManager: parse and analyze one report, publishing progress per stage.
+
+    Both stages are memoized by the PDF digest and the parser/prompt versions."""
+    from pdfhandle import aiter_medical_pdf
+
+    parse_key, analysis_key = _memo_keys(digest)
+    if (categorized := report_memo.get(analysis_key)) is not None:
+        job.stage("analyze", status="done")
+        return categorized
+    # Rows parsed earlier (e.g. the prompt version changed since) skip straight to analysis
+    parsed = report_memo.get(parse_key)
+
+    def on_parsed(count):
+        job.stage("parse", done=count)
+        job.stage("analyze", total=count)
+
+    analyzed = []
+    def on_analyzed(index, item, analysis):
+        analyzed.append(index)
+        job.stage("analyze", done=len(analyzed))
+
+    rows = _aiter(parsed) if parsed is not None else aiter_medical_pdf(io.BytesIO(pdf_bytes))
+    raw_data, analyses = analyze_parameters_as_parsed(rows, on_parsed=on_parsed, on_analyzed=on_analyzed)
+    job.stage("parse", status="done", done=len(raw_data))
+    job.stage("analyze", status="done")
+    if parsed is None:
+        report_memo.set(parse_key, raw_data)
+    if not raw_data:
+        raise ValueError("No parameters found in document")
+
+    categorized = {status: [] for status in VALID_STATUSES}
+    for item, analysis in zip(raw_data, analyses):
+        status = analysis.get("status") if analysis.get("status") in VALID_STATUSES else FALLBACK_ANALYSIS["status"]
+        categorized[status].append(build_row(item, {**FALLBACK_ANALYSIS, **analysis}))
+    # Reports with fallback answers are not memoized, so a later run can still get real ones
+    if all(analysis.get("status") in VALID_STATUSES and analysis != FALLBACK_ANALYSIS for analysis in analyses):
+        report_memo.set(analysis_key, categorized)
+    return categorized
\ No newline at end of file
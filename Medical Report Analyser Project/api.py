@@ -0,0 +1,271 @@
+# api.py - HTTP service over pdfhandle/analyze for EHR integrations (the Streamlit app stays for people)
+#
+#   uvicorn api:app --host 0.0.0.0 --port 8000
+#
+# Scale with API_MAX_CONCURRENCY rather than uvicorn --workers: every worker process has its own LLM rate
+# limiter and JobManager, so N workers spend N times the quota and don't share each other's running jobs.
+#
+#   curl -F file=@report.pdf localhost:8000/report
+#   curl -H "Content-Type: application/pdf" --data-binary @report.pdf localhost:8000/parse
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from analyze import analysis_cache, analyze_parameter_async, analyze_report_job, report_memo
+from jobs import get_job_manager
+from llm_async import gather_limited, run_async
+from pdfhandle import parse_medical_pdf
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("API_MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+# Requests doing parse/analyze work at once; the rest wait (within their timeout) for a slot
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "16"))
+API_PARSE_WORKERS = int(os.getenv("API_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+API_REQUEST_TIMEOUT = float(os.getenv("API_REQUEST_TIMEOUT_SECONDS", "120"))
+API_MAX_PARAMETERS = int(os.getenv("API_MAX_PARAMETERS", "500"))
+JOB_POLL_SECONDS = 0.1
+UPLOAD_CHUNK_BYTES = 64 * 1024
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+app = FastAPI(title="Medical Report Analyzer API")
+
+# Parsing is CPU-bound pdfplumber work, kept off the event loop and bounded separately from LLM calls
+_parse_pool = ThreadPoolExecutor(max_workers=API_PARSE_WORKERS, thread_name_prefix="parse")
+_slots = None
+
+_metrics_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+_in_flight = 0
+
+
+class Parameter(BaseModel):
+    test: str
+    value: str
+    reference: str = ""
+
+
+class AnalyzeRequest(BaseModel):
+    parameters: List[Parameter]
+
+
+def _get_slots():
+    # Created lazily so the semaphore binds to the server's event loop
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    return _slots
+
+
+async def _limited(factory, endpoint):
+    """Run factory() in a concurrency slot, failing with 504 once API_REQUEST_TIMEOUT has passed"""
+    async def run():
+        async with _get_slots():
+            return await factory()
+
+    try:
+        return await asyncio.wait_for(run(), API_REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        with _metrics_lock:
+            _counters[("api_timeouts_total", endpoint)] += 1
+        raise HTTPException(504, f"Request did not finish within {API_REQUEST_TIMEOUT:g}s")
+
+
+def _too_large():
+    return HTTPException(413, f"File exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)}MB limit")
+
+
+async def _upload_chunks(upload):
+    while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+        yield chunk
+
+
+async def _read_form(request):
+    """The multipart form, parsed only after the body has arrived within the limit.
+
+    Chunked uploads have no content-length to check up front, so the cap is applied as the body streams in;
+    the boundaries and part headers get UPLOAD_CHUNK_BYTES of room on top of the file itself."""
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_BYTES:
+            raise _too_large()
+
+    async def receive():
+        return {"type": "http.request", "body": bytes(body), "more_body": False}
+
+    return await Request(request.scope, receive).form(max_files=1)
+
+
+async def read_pdf(request):
+    """(bytes, sha256) of the uploaded PDF, read in chunks and refused as soon as it passes the size limit.
+
+    Accepts a raw application/pdf body (streamed straight from the socket) or a multipart "file" field."""
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(400, "Invalid Content-Length header")
+    if content_length > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_BYTES:
+        raise _too_large()
+    if request.headers.get("content-type", "").startswith("application/pdf"):
+        chunks = request.stream()
+    else:
+        form = await _read_form(request)
+        upload = form.get("file")
+        if not hasattr(upload, "read"):
+            raise HTTPException(422, "Send the PDF as the 'file' form field or as an application/pdf body")
+        chunks = _upload_chunks(upload)
+
+    data, digest = bytearray(), hashlib.sha256()
+    async for chunk in chunks:
+        data += chunk
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise _too_large()
+        digest.update(chunk)
+    if not data:
+        raise HTTPException(422, "Empty upload")
+    return bytes(data), digest.hexdigest()
+
+
+async def _parse(data):
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_parse_pool, parse_medical_pdf, io.BytesIO(data))
+    except Exception as e:
+        logger.error(f"Parsing failed: {str(e)}")
+        raise HTTPException(422, f"Could not read the PDF: {str(e)}")
+
+
+async def _analyze(items):
+    # The async client belongs to llm_async's loop, so the requests run there, under its rate limiter
+    return await run_async(gather_limited([
+        lambda item=item: analyze_parameter_async(item["test"], item["value"], item["reference"])
+        for item in items
+    ]))
+
+
+async def _wait_for_job(job):
+    while not job.finished:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+    if job.status == "failed":
+        raise HTTPException(422, f"Analysis failed: {job.error}")
+    return job.result
+
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    global _in_flight
+    started = time.perf_counter()
+    with _metrics_lock:
+        _in_flight += 1
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        seconds = time.perf_counter() - started
+        # The route template, not the raw path, so label values stay bounded
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        with _metrics_lock:
+            _in_flight -= 1
+            _counters[("api_requests_total", endpoint, str(status))] += 1
+            _counters[("api_request_seconds_sum", endpoint)] += seconds
+            _counters[("api_request_seconds_count", endpoint)] += 1
+            buckets = _histograms[endpoint]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+
+
+@app.post("/parse")
+async def parse(request: Request):
+    """Parameters found in the PDF, without analysis"""
+    data, digest = await read_pdf(request)
+    rows = await _limited(lambda: _parse(data), "/parse")
+    return {"digest": digest, "parameters": rows}
+
+
+@app.post("/analyze")
+async def analyze(body: AnalyzeRequest):
+    """Analysis of already-extracted parameters, in request order"""
+    if len(body.parameters) > API_MAX_PARAMETERS:
+        raise HTTPException(413, f"At most {API_MAX_PARAMETERS} parameters per request")
+    items = [parameter.model_dump() for parameter in body.parameters]
+    analyses = await _limited(lambda: _analyze(items), "/analyze")
+    return {"analyses": [{**item, **analysis} for item, analysis in zip(items, analyses)]}
+
+
+@app.post("/report")
+async def report(request: Request):
+    """Parse and analyze a PDF, grouped by status.
+
+    Runs as the same memoized background job the Streamlit app uses, so concurrent or repeated uploads of
+    one report share the work; after a timeout, retrying the upload picks up the job still running."""
+    data, digest = await read_pdf(request)
+    job = get_job_manager().submit(digest, analyze_report_job, data, digest)
+    categorized = await _limited(lambda: _wait_for_job(job), "/report")
+    return {"digest": digest, "categorized": categorized,
+            "parameters": sum(len(rows) for rows in categorized.values())}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+def _format_labels(**labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of request, timeout and cache metrics"""
+    with _metrics_lock:
+        counters = dict(_counters)
+        histograms = {endpoint: list(buckets) for endpoint, buckets in _histograms.items()}
+        in_flight = _in_flight
+
+    lines = ["# TYPE api_requests_total counter"]
+    for (name, endpoint, *status), value in sorted(counters.items()):
+        if name == "api_requests_total":
+            lines.append(f"api_requests_total{_format_labels(endpoint=endpoint, status=status[0])} {value:g}")
+    lines.append("# TYPE api_timeouts_total counter")
+    for (name, endpoint, *_), value in sorted(counters.items()):
+        if name == "api_timeouts_total":
+            lines.append(f"api_timeouts_total{_format_labels(endpoint=endpoint)} {value:g}")
+
+    lines.append("# TYPE api_request_seconds histogram")
+    for endpoint, buckets in sorted(histograms.items()):
+        for bound, count in zip(LATENCY_BUCKETS, buckets):
+            lines.append(f"api_request_seconds_bucket{_format_labels(endpoint=endpoint, le=bound)} {count}")
+        total = counters.get(("api_request_seconds_count", endpoint), 0)
+        lines.append(f"api_request_seconds_bucket{_format_labels(endpoint=endpoint, le='+Inf')} {total:g}")
+        lines.append(f"api_request_seconds_sum{_format_labels(endpoint=endpoint)} "
+                     f"{counters.get(('api_request_seconds_sum', endpoint), 0):g}")
+        lines.append(f"api_request_seconds_count{_format_labels(endpoint=endpoint)} {total:g}")
+
+    lines.append("# TYPE api_requests_in_flight gauge")
+    lines.append(f"api_requests_in_flight {in_flight}")
+    lines.append("# TYPE cache_hit_rate gauge")
+    for name, cache in (("analysis", analysis_cache), ("report_memo", report_memo)):
+        lines.append(f"cache_hit_rate{_format_labels(cache=name)} {cache.stats()['hit_rate']:.4f}")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
@@ -1,6 +1,7 @@
+import hashlib
 import streamlit as st
-from pdfhandle import parse_medical_pdf
-from analyze import analyze_parameter
+from analyze import ANALYSIS_CACHE_TTL, analyze_report_job, invalidate_report
+from jobs import get_job_manager
 
 st.set_page_config(
     page_title="Health Report Analyzer",
@@ -20,68 +21,75 @@ st.markdown("""
 uploaded_file = st.file_uploader(
     "Upload Medical Report (PDF, max 10MB)", 
     type="pdf",
-    help="We never store your medical data",
+    help=(f"The extracted values and analysis of each report are saved on this server for up to "
+          f"{ANALYSIS_CACHE_TTL // 86400} days, keyed by a fingerprint of the file, so re-uploading it is instant; "
+          "'Re-analyze' discards the saved report and rebuilds it"),
     accept_multiple_files=False
 )
 
+# Progress of the background job; reruns on its own until the job finishes
+@st.fragment(run_every=0.5)
+def show_job_progress(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        st.error("Analysis expired. Please upload the report again.")
+        return
+    snapshot = job.snapshot()
+    if snapshot["status"] == "done":
+        st.rerun()
+    if snapshot["status"] == "failed":
+        st.error(f"Analysis failed: {snapshot['error']}")
+        # Failed jobs are kept for a cooldown so reruns don't repeat the paid calls; retrying is explicit
+        if st.button("🔁 Retry", key=f"retry_{job_id}"):
+            get_job_manager().forget(job.key)
+            st.rerun()
+        return
+    
+    parsed = snapshot["stages"].get("parse", {}).get("done", 0)
+    analyzed = snapshot["stages"].get("analyze", {}).get("done", 0)
+    if snapshot["status"] == "queued":
+        st.progress(0.0, text="Waiting for a free worker...")
+    else:
+        st.progress(analyzed / max(parsed, 1), text=f"Analyzing your report... {analyzed} of {parsed} parameters")
+
 if uploaded_file:
     if uploaded_file.size > 10 * 1024 * 1024:
         st.error("❌ File size exceeds 10MB limit")
         st.stop()
     
-    with st.spinner("Analyzing your report..."):
-        try:
-            # Process PDF
-            raw_data = parse_medical_pdf(uploaded_file)
-            
-            if not raw_data:
-                st.error("No parameters found in document")
-                st.stop()
-            
-            # Process analysis
-            categorized = {
-                "Good": [],
-                "Moderate": [],
-                "Immediate Attention": []
-            }
-            
-            for item in raw_data:
-                analysis = analyze_parameter(
-                    item["test"], 
-                    item["value"], 
-                    item["reference"]
-                )
-                row = {
-                    "Parameter": item["test"],
-                    "Value": f"{item['value']} (Ref: {item['reference']})",
-                    "Reason": analysis["reason"],
-                    "Food": analysis["food"],
-                    "Exercise": analysis["exercise"]
-                }
-                categorized[analysis["status"]].append(row)
-            
-            # Display results
-            st.success("Analysis Complete!")
-            st.warning("❗ This tool provides general insights only. Always consult a healthcare professional.")
-            
-            for status in ["Good", "Moderate", "Immediate Attention"]:
-                if data := categorized[status]:
-                    st.subheader(f"{status} Parameters ({len(data)})")
-                    st.dataframe(
-                        data,
-                        column_config={
-                            "Parameter": "Medical Parameter",
-                            "Value": st.column_config.Column(
-                                "Value with Reference",
-                                help="Hover over values to see reference ranges"
-                            ),
-                            "Reason": "Clinical Significance",
-                            "Food": "Dietary Recommendations",
-                            "Exercise": "Activity Guidance"
-                        },
-                        use_container_width=True,
-                        hide_index=True
-                    )
-            
-        except Exception as e:
-            st.error(f"Analysis failed: {str(e)}")
\ No newline at end of file
+    # Runs on a shared worker pool, so reruns never repeat it and identical uploads share one job;
+    # results are memoized by the file's digest, so the same report is never billed twice
+    data = uploaded_file.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    job = get_job_manager().submit(digest, analyze_report_job, data, digest)
+    if job.status != "done":
+        show_job_progress(job.id)
+        st.stop()
+    categorized = job.result
+    
+    # Display results
+    st.success("Analysis Complete!")
+    if st.button("🔄 Re-analyze", help="Discard the saved parse and cached answers for this report and ask the model again"):
+        invalidate_report(digest)
+        get_job_manager().forget(digest)
+        st.rerun()
+    st.warning("❗ This tool provides general insights only. Always consult a healthcare professional.")
+    
+    for status in ["Good", "Moderate", "Immediate Attention"]:
+        if data := categorized[status]:
+            st.subheader(f"{status} Parameters ({len(data)})")
+            st.dataframe(
+                data,
+                column_config={
+                    "Parameter": "Medical Parameter",
+                    "Value": st.column_config.Column(
+                        "Value with Reference",
+                        help="Hover over values to see reference ranges"
+                    ),
+                    "Reason": "Clinical Significance",
+                    "Food": "Dietary Recommendations",
+                    "Exercise": "Activity Guidance"
+                },
+                use_container_width=True,
+                hide_index=True
+            )
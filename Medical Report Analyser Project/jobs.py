@@ -0,0 +1,191 @@
+# jobs.py - background report jobs: one per content hash, polled for per-stage progress from any rerun
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs stay pollable this long, so a session that reconnects still gets its result
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+# A failed job is returned to every submit for this long, so page reruns after a failure don't repeat the
+# parse and the paid LLM calls; JobManager.forget(key) (the apps' Retry button) runs it again straight away
+JOB_FAILURE_COOLDOWN_SECONDS = float(os.getenv("JOB_FAILURE_COOLDOWN_SECONDS", "300"))
+
+
+class JobCancelled(Exception):
+    """Raised by Job.check() once nobody is waiting for the job any more"""
+
+
+class Job:
+    """State of one submitted report; the worker writes it and any number of sessions read snapshots"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.status = "queued"          # queued -> running -> done | failed | cancelled
+        self.stages = {}
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        # Sessions waiting for the result; None stands for callers that never unsubscribe (API, batch)
+        self.subscribers = set()
+        self._cancelled = threading.Event()
+        self._on_cancel = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+    def on_cancel(self, callback):
+        """Call callback when the job is cancelled (right away if it already is), e.g. to drop in-flight work"""
+        with self._lock:
+            if not self.cancelled:
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self._cancelled.set()
+            callbacks, self._on_cancel = self._on_cancel, []
+        for callback in callbacks:
+            callback()
+
+    def stage(self, name, status=None, done=None, total=None):
+        """Update a stage's progress; stages appear in the order they first report"""
+        with self._lock:
+            entry = self.stages.setdefault(name, {"status": "running", "done": 0, "total": None,
+                                                  "started": time.time(), "finished": None})
+            if status is not None:
+                entry["status"] = status
+                if status in ("done", "failed"):
+                    entry["finished"] = time.time()
+            if done is not None:
+                entry["done"] = done
+            if total is not None:
+                entry["total"] = total
+
+    def publish(self, **values):
+        """Intermediate results (rows so far, summary so far) for live views"""
+        with self._lock:
+            self.partial.update(values)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "stages": {name: dict(entry) for name, entry in self.stages.items()},
+                "partial": dict(self.partial),
+                "error": self.error,
+                "elapsed": (self.finished or time.time()) - self.created
+            }
+
+
+class JobManager:
+    """Worker pool with de-duplication: submitting the same key again returns the job already running.
+
+    Jobs are reference-counted by subscriber; one whose last subscriber leaves before it finishes is cancelled."""
+
+    def __init__(self, workers=JOB_WORKERS, retention=JOB_RETENTION_SECONDS, failure_cooldown=JOB_FAILURE_COOLDOWN_SECONDS):
+        self.retention = retention
+        self.failure_cooldown = failure_cooldown
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, subscriber=None):
+        """Run fn(job, *args) in the pool unless a job exists for key (failed ones within their cooldown); returns the Job.
+
+        subscriber (e.g. a session id) is added to the job's subscribers; without one the job is never cancelled."""
+        with self._lock:
+            self._prune()
+            if (job := self._by_key.get(key)) and not job.cancelled and not self._cooled_down(job):
+                job.subscribers.add(subscriber)
+                return job
+            job = Job(key)
+            job.subscribers.add(subscriber)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        self._executor.submit(self._run, job, fn, args)
+        logger.info(f"Queued job {job.id} for {key[:12]}")
+        return job
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        try:
+            job.check()
+            job.result = fn(job, *args)
+            job.status = "done"
+        except Exception as e:
+            if job.cancelled:
+                job.status = "cancelled"
+            else:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = "failed"
+        finally:
+            job.finished = time.time()
+        logger.info(f"Job {job.id} {job.status} in {job.finished - job.created:.2f}s")
+
+    def _cooled_down(self, job):
+        return job.status == "failed" and job.finished and time.time() - job.finished >= self.failure_cooldown
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def unsubscribe(self, job_id, subscriber):
+        """Drop subscriber from the job; if nobody else is waiting for it and it hasn't finished, cancel it"""
+        with self._lock:
+            if not (job := self._jobs.get(job_id)):
+                return
+            job.subscribers.discard(subscriber)
+            if job.subscribers or job.finished:
+                return
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+        logger.info(f"Cancelling job {job.id}: no subscribers left")
+        job.cancel()
+
+    def forget(self, key):
+        """Drop the finished job for key so the next submit runs again (an explicit retry, or after invalidating its cache)"""
+        with self._lock:
+            if (job := self._by_key.get(key)) and job.finished:
+                del self._by_key[key]
+                self._jobs.pop(job.id, None)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished < cutoff:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """The process-wide job manager shared by every session"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
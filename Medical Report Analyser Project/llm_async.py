@@ -0,0 +1,127 @@
+# llm_async.py - async execution helpers for Azure OpenAI calls
+import asyncio
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Deployment quota (Azure shows these per deployment in the portal)
+AZURE_OPENAI_RPM = int(os.getenv("AZURE_OPENAI_RPM", "300"))
+AZURE_OPENAI_TPM = int(os.getenv("AZURE_OPENAI_TPM", "50000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+
+class RateLimiter:
+    """Token bucket that keeps requests and tokens within the deployment's per-minute quota"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        # A thread lock (not asyncio.Lock) so one limiter can be shared across event loops
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _reserve(self, tokens):
+        """Take capacity for one request, or return how many seconds to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            tokens = min(tokens, self.tpm)
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                return 0.0
+
+            wait_requests = (1 - self._requests) * 60 / self.rpm if self._requests < 1 else 0.0
+            wait_tokens = (tokens - self._tokens) * 60 / self.tpm if self._tokens < tokens else 0.0
+            return max(wait_requests, wait_tokens)
+
+    async def acquire(self, tokens):
+        while (delay := self._reserve(tokens)) > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, tokens):
+        while (delay := self._reserve(tokens)) > 0:
+            time.sleep(delay)
+
+    def refund(self, reserved, used):
+        """Return unused capacity once the real token usage of a request is known"""
+        if used is None or used >= reserved:
+            return
+        with self._lock:
+            self._tokens = min(self.tpm, self._tokens + reserved - used)
+
+    def pause(self, seconds):
+        """Hold back every caller, e.g. for the retry-after period of a 429 response"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logger.warning(f"Rate limited by Azure OpenAI, pausing requests for {seconds:.1f}s")
+
+
+def retry_after_seconds(error, default):
+    """Read the retry-after delay from a 429 error, falling back to `default` seconds"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return default
+
+
+rate_limiter = RateLimiter(AZURE_OPENAI_RPM, AZURE_OPENAI_TPM)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    """Start (once) the background event loop that owns the async clients"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-async-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared event loop and block until it finishes.
+
+    Async clients keep pooled connections bound to the loop that opened them, so every
+    call goes through one long-lived loop instead of a fresh asyncio.run() per rerun.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+async def run_async(coro):
+    """Await a coroutine on the shared event loop from another event loop (e.g. the API server's)"""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_loop()))
+
+
+async def gather_limited(coroutine_factories, max_concurrency=LLM_MAX_CONCURRENCY):
+    """Await coroutines with bounded concurrency, returning results in input order"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(factory):
+        async with semaphore:
+            return await factory()
+
+    return await asyncio.gather(*(run(factory) for factory in coroutine_factories))
@@ -1,4 +1,5 @@
 # pdfhandle.py (Revised)
+import asyncio
 import pdfplumber
 import re
 import logging
@@ -6,9 +7,15 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump whenever parsing changes so rows memoized by the old parser are ignored
+PARSER_VERSION = "1"
+
 def parse_medical_pdf(pdf_file):
     """Robust PDF parser for medical reports"""
-    results = []
+    return list(iter_medical_pdf(pdf_file))
+
+def iter_medical_pdf(pdf_file):
+    """Yield {test, value, reference} rows as soon as each line matches, one page in memory at a time"""
     header_found = False
     header_pattern = re.compile(
         r'TEST\s+NAME\s+OBSERVED\s+VALUE\s+UNITS\s+BIO\.?\s+REF\.?\s*INTERVAL',
@@ -47,13 +54,28 @@ def parse_medical_pdf(pdf_file):
                     # Extract data using regex
                     if match := data_pattern.match(line):
                         data = match.groupdict()
-                        results.append({
+                        logger.info(f"Valid row: {data}")
+                        yield {
                             "test": data['test'],
                             "value": data['value'],
                             "reference": f"{data['ref']} {data['units']}"
-                        })
-                        logger.info(f"Valid row: {data}")
+                        }
                     else:
                         logger.warning(f"Skipped line: {line}")
-    
-    return results
\ No newline at end of file
+            
+            # Drop the page's parsed objects so long PDFs don't accumulate them
+            page.flush_cache()
+
+async def aiter_medical_pdf(pdf_file):
+    """Async variant of iter_medical_pdf; parsing runs in a worker thread so the event loop stays free"""
+    rows = iter_medical_pdf(pdf_file)
+    done = object()
+    try:
+        while (row := await asyncio.to_thread(next, rows, done)) is not done:
+            yield row
+    finally:
+        try:
+            rows.close()
+        except ValueError:
+            # Cancelled while a worker thread is still inside next(); it finishes on its own
+            pass